@@ -1,23 +1,110 @@
 from __future__ import absolute_import
+import sys
+
 from . import iso, source
 
 
-def parse(path_or_url, cache_content=False, min_fetch=16):
+def parse(path_or_url, cache_content=False, min_fetch=16, mmap=False, cache_bytes=None,
+          content_cache_bytes=None, cache=None, name_index_size=1 << 16, index=None,
+          disk_cache=None, joliet=None, fetch_hook=None, timings=False, max_fetch=512,
+          lazy=False):
     """
     Returns an :class:`ISO` object for the given filesystem path or URL.
 
     cache_content:
       Whether to store sectors backing file content in the sector cache. If true, this will
-      cause memory usage to grow to the size of the ISO as more file content get accessed.
-      Even if false (default), an individual Record object will cache its own file content
-      for the lifetime of the Record, once accessed.
+      cause memory usage to grow to the size of the ISO as more file content get accessed,
+      unless ``content_cache_bytes`` is set. Even if false (default), an individual Record
+      object will cache its own file content for the lifetime of the Record, once accessed.
+
+    min_fetch, max_fetch:
+      The smallest and largest number of sectors to fetch in a single operation, to speed up
+      sequential accesses, e.g. for directory traversal. Between these, the readahead window
+      adapts to the pattern of reads, growing while they move forward through the image and
+      shrinking on random access; see ``ISO.advise()`` for hints. Default to 16 sectors (32 KiB)
+      and 512 sectors (1 MiB).
+
+    mmap:
+      Whether to memory-map a local image rather than reading it through the sector cache. If
+      true, no sectors are cached or copied: file content and streams are ``memoryview`` objects
+      referencing the mapping, and ``cache_content``, ``min_fetch`` and ``max_fetch`` have no
+      effect. Ignored for URLs.
+
+    cache_bytes, content_cache_bytes:
+      Byte budgets for cached metadata and content sectors respectively. Once a budget is
+      exceeded, the least recently used sectors are evicted. Defaults to no limit.
+
+    cache:
+      A sector cache to use instead of a new :class:`cache.SectorCache`, e.g. one with a different
+      eviction policy. If given, ``cache_bytes`` and ``content_cache_bytes`` are ignored.
+
+    name_index_size:
+      :func:`ISO.record` keeps a name-to-child index for each directory it resolves a path
+      through. This bounds the total number of children held in those indexes, evicting the
+      least recently used directories first. Defaults to 65536.
+
+    index:
+      Path to a sidecar index written by :func:`ISO.build_index` for this image. Metadata is then
+      read from the index rather than the image. The index is ignored if it's missing, or was built
+      for a different image. Has no effect with ``mmap=True``.
+
+    disk_cache:
+      For URLs, a directory in which to keep a persistent copy of the sectors fetched, which may
+      be shared between processes. See :class:`cache.DiskCache`. Ignored for local files.
 
-    min_fetch:
-      The smallest number of sectors to fetch in a single operation, to speed up sequential
-      accesses, e.g. for directory traversal.  Defaults to 16 sectors, or 32 KiB.
+    joliet:
+      Whether ``ISO.root`` and :func:`ISO.record` use the image's Joliet hierarchy, if it has one,
+      rather than the primary hierarchy. Joliet names are returned as UTF-8. Defaults to None,
+      which uses Joliet only if the image has no Rock Ridge extensions.
+
+    fetch_hook:
+      A callable called as ``hook(sector, count, duration)`` after every fetch from the image, e.g.
+      for tracing. It can also be set later through ``ISO.fetch_hook``. Defaults to None.
+
+    timings:
+      Whether to collect a histogram of fetch durations in ``ISO.stats``. Defaults to false, in
+      which case fetches are only timed while a fetch hook is set.
+
+    lazy:
+      Whether to defer reading the image's metadata until it's needed. If true, opening the image
+      reads a single sector, holding the primary volume descriptor, which is then available as
+      ``ISO.primary_vd``. The other volume descriptors, the path table and the check for SUSP and
+      Rock Ridge in the root directory are each read on first use. Defaults to false.
     """
+    kwargs = dict(
+        cache_content=cache_content,
+        min_fetch=min_fetch,
+        max_fetch=max_fetch,
+        cache=cache,
+        cache_bytes=cache_bytes,
+        content_cache_bytes=content_cache_bytes,
+        fetch_hook=fetch_hook,
+        timings=timings)
     if path_or_url.startswith("http"):
-        src = source.HTTPSource(path_or_url, cache_content=cache_content, min_fetch=min_fetch)
+        src = source.HTTPSource(path_or_url, disk_cache=disk_cache, **kwargs)
+    elif mmap:
+        src = source.MmapSource(path_or_url, **kwargs)
     else:
-        src = source.FileSource(path_or_url, cache_content=cache_content, min_fetch=min_fetch)
-    return iso.ISO(src)
+        src = source.FileSource(path_or_url, **kwargs)
+
+    # Identifies the image to worker processes resolving refs to its records. Options that
+    # can't be pickled or shared are left out.
+    options = dict(
+        kwargs, mmap=mmap, name_index_size=name_index_size, index=index, disk_cache=disk_cache,
+        joliet=joliet, lazy=lazy)
+    del options['cache'], options['fetch_hook']
+    image = (path_or_url, tuple(sorted(options.items())))
+    return iso.ISO(src, name_index_size=name_index_size, index=index, joliet=joliet, lazy=lazy,
+                   image=image)
+
+
+def aparse(path_or_url, **kwargs):
+    """
+    Returns an awaitable that resolves to an :class:`aio.AsyncISO` object for the given filesystem
+    path or URL, reading the image without blocking the event loop. See :func:`aio.aparse`.
+    Requires Python 3.6 or later.
+    """
+    if sys.version_info < (3, 6):
+        raise NotImplementedError("aparse() requires Python 3.6 or later")
+    from . import aio
+    return aio.aparse(path_or_url, **kwargs)
@@ -0,0 +1,106 @@
+"""
+A local HTTP server answering range requests, which the benchmark's HTTP source and the tests
+read images from. It isn't part of the public API.
+"""
+import os
+import re
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+
+
+class RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves files from the server's root directory, honouring ``Range`` headers. Multiple ranges
+    are answered with a ``multipart/byteranges`` response. Only the bytes requested are read.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, so with Nagle's algorithm each response would wait
+    # for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.requests += 1
+        path = os.path.join(self.server.root, self.path.lstrip("/"))
+        try:
+            f = open(path, "rb")
+        except IOError:
+            self.send_error(404)
+            return
+        with f:
+            self._send(f, os.fstat(f.fileno()).st_size)
+
+    def _send(self, f, size):
+        def read(start, end):
+            f.seek(start)
+            return f.read(end + 1 - start)
+
+        header = self.headers.get("Range", "")
+        if not header.startswith("bytes="):
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            self.wfile.write(read(0, size - 1))
+            return
+
+        ranges = []
+        for byte_range in header[6:].split(","):
+            match = re.match(r"(\d+)-(\d*)$", byte_range.strip())
+            start = int(match.group(1))
+            end = min(int(match.group(2) or size - 1), size - 1)
+            if start < size:
+                ranges.append((start, end))
+        if not ranges:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */%d" % size)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.server.ranges += len(ranges)
+        self.send_response(206)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+            body = read(start, end)
+        else:
+            self.send_header("Content-Type", "multipart/byteranges; boundary=BOUNDARY")
+            body = b"".join(
+                b"\r\n--BOUNDARY\r\nContent-Range: bytes %d-%d/%d\r\n\r\n" % (
+                    start, end, size) + read(start, end)
+                for start, end in ranges) + b"\r\n--BOUNDARY--\r\n"
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A range-capable HTTP server on a free local port, serving files from ``root`` in a background
+    thread. Counts the connections, requests and byte ranges it handles.
+    """
+    daemon_threads = True
+
+    def __init__(self, root):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), RangeRequestHandler)
+        self.root = root
+        self.connections = 0
+        self.requests = 0
+        self.ranges = 0
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_request(self):
+        self.connections += 1
+        return BaseHTTPServer.HTTPServer.get_request(self)
+
+    def url(self, name):
+        return "http://127.0.0.1:%d/%s" % (self.server_address[1], name)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
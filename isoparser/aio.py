@@ -0,0 +1,313 @@
+"""
+An asyncio front end. Reads are made without blocking the event loop: local images are read on
+an executor, and remote images with an asyncio HTTP range client. The sectors read are placed in
+the sector cache of an ordinary source, and decoded from there by the usual record and SUSP
+decoders, so each read is awaited before the synchronous code that needs it runs.
+
+This module requires Python 3.6 or later.
+"""
+import asyncio
+import ssl
+
+from six.moves.urllib.parse import urlsplit
+
+from . import iso as iso_module, source as source_module
+from .source import SECTOR_LENGTH, SourceError
+
+
+class FileReader(object):
+    """
+    Reads sectors of a :class:`source.FileSource` on an executor.
+    """
+    def __init__(self, source, executor=None):
+        self._source = source
+        self._executor = executor
+
+    async def read_into(self, sector, buff):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._source._fetch_into, sector, buff)
+
+    async def close(self):
+        pass
+
+
+class HTTPReader(object):
+    """
+    Reads sectors over HTTP(S) with range requests on asyncio streams. Connections are kept alive,
+    with at most ``pool_size`` in use at once.
+    """
+    def __init__(self, url, pool_size=4):
+        parts = urlsplit(url)
+        self._ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self._host = parts.hostname
+        self._port = parts.port or (443 if self._ssl else 80)
+        self._netloc = parts.netloc
+        self._path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        self._pool = []
+        self._pool_size = pool_size
+        self._semaphore = None
+
+    async def _request(self, byte_range):
+        request = ("GET %s HTTP/1.1\r\nHost: %s\r\nRange: bytes=%s\r\n\r\n" % (
+            self._path, self._netloc, byte_range)).encode("ascii")
+        for attempt in range(2):
+            if self._pool:
+                reader, writer = self._pool.pop()
+            else:
+                reader, writer = await asyncio.open_connection(
+                    self._host, self._port, ssl=self._ssl)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+                if status_line:
+                    break
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            # An idle connection may have been closed by the server; retry once on a new one
+            writer.close()
+            if attempt:
+                raise SourceError("HTTP connection closed")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "identity") != "identity":
+            writer.close()
+            raise SourceError("Unsupported Transfer-Encoding in HTTP response")
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close" or len(self._pool) >= self._pool_size:
+            writer.close()
+        else:
+            self._pool.append((reader, writer))
+        return int(status_line.split()[1]), headers, body
+
+    async def read_into(self, sector, buff):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._pool_size)
+        offset = sector * SECTOR_LENGTH
+        async with self._semaphore:
+            status, headers, body = await self._request(
+                "%d-%d" % (offset, offset + len(buff) - 1))
+        if status == 416:
+            return 0
+        if status != 206:
+            raise SourceError("Expected HTTP 206 response to range request, got %d" % status)
+        start, end, _ = source_module._parse_content_range(headers.get("content-range", ""))
+        if start != offset or end >= offset + len(buff):
+            raise SourceError("HTTP 206 response has the wrong range: %d-%d" % (start, end))
+        if len(body) != end - start + 1:
+            raise SourceError("HTTP 206 response length doesn't match its Content-Range")
+        buff[:len(body)] = body
+        return len(body)
+
+    async def close(self):
+        pool, self._pool = self._pool, []
+        for _, writer in pool:
+            writer.close()
+
+
+class AsyncSource(object):
+    """
+    Pairs a synchronous source with an asynchronous reader, which fills the source's sector cache
+    ahead of the synchronous decoding.
+    """
+    def __init__(self, source, reader):
+        self.source = source
+        self.reader = reader
+
+    async def prefetch(self, extents):
+        """
+        Reads any sectors of the given (sector, length) extents that aren't already held into the
+        sector cache, fetching runs concurrently.
+        """
+        await asyncio.gather(*[self._prefetch_run(sector, count)
+                               for sector, count in self.source.missing_runs(extents)])
+
+    async def _prefetch_run(self, sector, count):
+        buff = memoryview(bytearray(count * SECTOR_LENGTH))
+        start = source_module._clock() if self.source._timed else None
+        got = await self.reader.read_into(sector, buff)
+        self.source._count_fetch(sector, count, got,
+                                 None if start is None else source_module._clock() - start)
+        self.source.cache_sectors(sector, buff[:got])
+
+    async def prefetch_susp(self, records):
+        """
+        Reads the continuation areas referenced by the embedded SUSP entries of the given records
+        into the sector cache.
+        """
+        await self.prefetch([area for record in records for area in record.continuation_areas])
+
+    async def prefetch_directory(self, record):
+        """
+        Reads a directory extent, and the continuation areas of its children, into the sector
+        cache.
+        """
+        await self.prefetch([(record.location, record.length)])
+        await self.prefetch_susp(record.children_unsafe)
+
+    async def read_at(self, offset, length):
+        start_sector, skip = divmod(offset, SECTOR_LENGTH)
+        buff = memoryview(bytearray(skip + length))
+        got = await self.reader.read_into(start_sector, buff)
+        return bytes(buff[skip:max(skip, got)])
+
+    async def close(self):
+        await self.reader.close()
+        self.source.close()
+
+
+class AsyncISO(object):
+    """
+    Asynchronous counterpart to :class:`iso.ISO`, returned by :func:`aparse`. Attributes other
+    than those below are those of the wrapped ``ISO``.
+    """
+    def __init__(self, iso, source):
+        self.iso = iso
+        self._source = source
+        self.root = AsyncRecord(self, iso.root)
+
+    def __getattr__(self, name):
+        return getattr(self.iso, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._source.close()
+
+    async def arecord(self, *path):
+        """
+        Retrieves a record for the given path.
+        """
+        iso = self.iso
+        path, pivot = iso._path_table_prefix(path)
+        if pivot > 0:
+            table = iso._lookup_path_table
+            await self._source.prefetch([(table.paths[tuple(path[:pivot])], SECTOR_LENGTH)])
+            record = table.record(*path[:pivot])
+            await self._source.prefetch_susp([record])
+        else:
+            record = iso.root
+
+        for part in path[pivot:]:
+            index = iso._cached_name_index(record)
+            if index is None:
+                # Read the directory without blocking before indexing it
+                await self._source.prefetch_directory(record)
+                index = iso._name_index(record)
+            record = index[part]
+
+        return AsyncRecord(self, record)
+
+
+class AsyncRecord(object):
+    """
+    Asynchronous counterpart to :class:`record.Record`. Attributes other than those below are
+    those of the wrapped ``Record``.
+    """
+    def __init__(self, iso, record):
+        self._iso = iso
+        self.record = record
+        self.position = 0
+
+    def __getattr__(self, name):
+        return getattr(self.record, name)
+
+    def __repr__(self):
+        return repr(self.record)
+
+    async def achildren(self):
+        """
+        Assuming this is a directory record, yields a record for each child.
+        """
+        await self._iso._source.prefetch_directory(self.record)
+        for child in self.record.children:
+            yield AsyncRecord(self._iso, child)
+
+    async def aread(self, size=-1):
+        """
+        Assuming this is a file record, reads and returns up to ``size`` bytes of its content from
+        the current position, or all remaining content if ``size`` is negative.
+        """
+        assert not self.record.is_directory
+        remaining = self.record.length - self.position
+        if size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b""
+        data = await self._iso._source.read_at(
+            self.record.location * SECTOR_LENGTH + self.position, size)
+        self.position += len(data)
+        return data
+
+
+# Options of parse() that aparse() doesn't support: memory-mapped reads would block the event loop
+# on page faults, sidecar indexes are read synchronously, the metadata is always read up front, and
+# the asynchronous HTTP reader bypasses the disk cache
+_UNSUPPORTED = ("mmap", "index", "lazy", "disk_cache")
+
+
+async def aparse(path_or_url, executor=None, pool_size=4, cache_content=False, min_fetch=16,
+                 cache_bytes=None, content_cache_bytes=None, cache=None, name_index_size=1 << 16,
+                 joliet=None, fetch_hook=None, timings=False, max_fetch=512, **kwargs):
+    """
+    Returns an :class:`AsyncISO` object for the given filesystem path or URL. Local images are
+    read on the given executor, or the event loop's default executor. Remote images are read with
+    up to ``pool_size`` concurrent connections. Other keyword arguments are as for ``parse()``,
+    except that ``mmap``, ``index``, ``lazy`` and ``disk_cache`` aren't supported; giving any of
+    them a value other than its default raises ValueError.
+    """
+    for name, value in kwargs.items():
+        if name not in _UNSUPPORTED:
+            raise TypeError("aparse() got an unexpected keyword argument %r" % (name,))
+        if value:
+            raise ValueError("aparse() doesn't support the %r option" % (name,))
+    kwargs = dict(
+        cache_content=cache_content,
+        min_fetch=min_fetch,
+        max_fetch=max_fetch,
+        cache=cache,
+        cache_bytes=cache_bytes,
+        content_cache_bytes=content_cache_bytes,
+        fetch_hook=fetch_hook,
+        timings=timings)
+    if path_or_url.startswith("http"):
+        src = source_module.HTTPSource(path_or_url, **kwargs)
+        reader = HTTPReader(path_or_url, pool_size)
+    else:
+        src = source_module.FileSource(path_or_url, **kwargs)
+        reader = FileReader(src, executor)
+    asrc = AsyncSource(src, reader)
+
+    try:
+        # Read the volume descriptors, path table and root directory before decoding them
+        await asrc.prefetch([(16, src.min_fetch * SECTOR_LENGTH)])
+        sector = 16
+        while True:
+            await asrc.prefetch([(sector, SECTOR_LENGTH)])
+            vd = src.buffer(sector).unpack_volume_descriptor()
+            sector += 1
+            if vd.name == "primary":
+                pvd = vd
+            if vd.name == "terminator":
+                break
+        await asrc.prefetch([(pvd.path_table_l_loc, pvd.path_table_size),
+                             (pvd.root_record.location, pvd.root_record.length)])
+        await asrc.prefetch_susp([pvd.root_record.current_directory])
+        iso = iso_module.ISO(src, name_index_size=name_index_size, joliet=joliet)
+        if iso.joliet:
+            await asrc.prefetch([(iso.joliet_vd.path_table_l_loc, iso.joliet_vd.path_table_size)])
+        return AsyncISO(iso, asrc)
+    except BaseException:
+        await asrc.close()
+        raise
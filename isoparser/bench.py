@@ -0,0 +1,221 @@
+"""
+Benchmarks for the open, lookup, walk and read paths, run against synthetic images.
+
+Run ``python -m isoparser.bench --help`` for options. Results are written as JSON, one object per
+image variant and source, so that runs can be compared across releases.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import isoparser
+
+from . import synthetic
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+VARIANTS = {
+    "plain": dict(rock_ridge=False, continuation=False),
+    "rockridge": dict(rock_ridge=True, continuation=False),
+    "continuation": dict(rock_ridge=True, continuation=True),
+}
+
+
+def _file_paths(tree, path=()):
+    for name, value in sorted(tree.items()):
+        if isinstance(value, dict):
+            for item in _file_paths(value, path + (name,)):
+                yield item
+        else:
+            yield path + (name,)
+
+
+def _timed(fn):
+    start = _clock()
+    result = fn()
+    return _clock() - start, result
+
+
+def bench_image(path_or_url, file_paths, repeat=3, lookups=200, **parse_kwargs):
+    """
+    Returns a dict of measurements for one image.
+    """
+    def parse():
+        return isoparser.parse(path_or_url, **parse_kwargs)
+
+    results = {}
+
+    # Open time: parse() up to the root record
+    times = []
+    for _ in range(repeat):
+        elapsed, iso = _timed(parse)
+        times.append(elapsed)
+        iso.close()
+    results["open_s"] = min(times)
+
+    # Lazy open time: parse(lazy=True) up to the primary volume descriptor
+    times = []
+    for _ in range(repeat):
+        elapsed, iso = _timed(lambda: isoparser.parse(path_or_url, lazy=True, **parse_kwargs))
+        times.append(elapsed)
+        iso.close()
+    results["open_lazy_s"] = min(times)
+
+    # Lookup latency: first lookups on a fresh ISO (cold), then the same lookups again (warm)
+    sample = random.Random(0).sample(file_paths, min(lookups, len(file_paths)))
+    with parse() as iso:
+        cold, _ = _timed(lambda: [iso.record(*path) for path in sample])
+        warm, _ = _timed(lambda: [iso.record(*path) for path in sample])
+    results["lookup_cold_us"] = cold / len(sample) * 1e6 if sample else None
+    results["lookup_warm_us"] = warm / len(sample) * 1e6 if sample else None
+
+    # Full walk, decoding every name
+    def walk():
+        with parse() as iso:
+            entries = 0
+            for _, dirs, files in iso.walk():
+                for record in dirs + files:
+                    record.name
+                entries += len(dirs) + len(files)
+            return entries
+
+    times = []
+    for _ in range(repeat):
+        elapsed, entries = _timed(walk)
+        times.append(elapsed)
+    results["walk_s"] = min(times)
+    results["walk_entries"] = entries
+
+    # Peak Python memory during a walk
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            walk()
+            results["walk_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Content throughput, whole files and streamed
+    with parse() as iso:
+        records = [iso.record(*path) for path in file_paths]
+        elapsed, total = _timed(lambda: sum(len(record.content) for record in records))
+        results["content_mb_s"] = total / elapsed / 1e6 if elapsed else None
+
+        def stream():
+            total = 0
+            for record in records:
+                with record.open() as f:
+                    while True:
+                        data = f.read(1 << 16)
+                        if not data:
+                            break
+                        total += len(data)
+            return total
+        elapsed, total = _timed(stream)
+        results["stream_mb_s"] = total / elapsed / 1e6 if elapsed else None
+
+        # Batched, coalesced reads of the same files
+        elapsed, _ = _timed(lambda: sum(len(data) for _, data in iso.read_many(records)))
+        results["read_many_mb_s"] = total / elapsed / 1e6 if elapsed else None
+    results["content_bytes"] = total
+    return results
+
+
+def run(files=2000, fanout=8, depth=2, name_length=24, file_size=4096, repeat=3, lookups=200,
+        variants=tuple(VARIANTS), sources=("file", "mmap", "http")):
+    """
+    Generates an image for each variant and benchmarks it on each source. Returns the results as
+    a JSON-serialisable dict.
+    """
+    params = dict(files=files, fanout=fanout, depth=depth, name_length=name_length,
+                  file_size=file_size, repeat=repeat, lookups=lookups)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": [],
+    }
+
+    tmpdir = tempfile.mkdtemp(prefix="isoparser-bench-")
+    server = None
+    try:
+        if "http" in sources:
+            from ._range_server import RangeServer
+            server = RangeServer(tmpdir)
+
+        for variant in variants:
+            options = VARIANTS[variant]
+            tree = synthetic.generate_tree(files, fanout, depth, name_length, file_size,
+                                           rock_ridge=options["rock_ridge"])
+            name = variant + ".iso"
+            path = os.path.join(tmpdir, name)
+            elapsed, _ = _timed(lambda: synthetic.write(path, tree, **options))
+            paths = list(_file_paths(tree))
+            tree = None
+
+            for source in sources:
+                if source == "file":
+                    target, kwargs = path, {}
+                elif source == "mmap":
+                    target, kwargs = path, {"mmap": True}
+                elif source == "http":
+                    if server is None:
+                        continue
+                    target, kwargs = server.url(name), {}
+                else:
+                    raise ValueError("Unknown source: %r" % (source,))
+                result = {
+                    "variant": variant,
+                    "source": source,
+                    "image_bytes": os.path.getsize(path),
+                    "write_s": elapsed,
+                }
+                result.update(bench_image(target, paths, repeat, lookups, **kwargs))
+                report["results"].append(result)
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(tmpdir)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m isoparser.bench", description=__doc__.strip())
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--name-length", type=int, default=24)
+    parser.add_argument("--file-size", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--variants", default=",".join(sorted(VARIANTS)),
+                        help="comma-separated: %s" % ", ".join(sorted(VARIANTS)))
+    parser.add_argument("--sources", default="file,mmap,http",
+                        help="comma-separated: file, mmap, http")
+    parser.add_argument("--output", help="write JSON here rather than to stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args.files, args.fanout, args.depth, args.name_length, args.file_size,
+                 args.repeat, args.lookups, args.variants.split(","), args.sources.split(","))
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        sys.stdout.write(data + "\n")
+
+
+if __name__ == "__main__":
+    main()
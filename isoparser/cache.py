@@ -0,0 +1,245 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LRUSegment(object):
+    """
+    A mapping of sector numbers to sector data which evicts the least recently used sectors once
+    the total size of the data held exceeds a byte budget. A budget of None means unbounded.
+
+    Sizes are measured with ``len()``, so values may be any sized container, with the budget then
+    counting their items instead.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, sector):
+        return sector in self._entries
+
+    def get(self, sector):
+        data = self._entries.pop(sector, None)
+        if data is not None:
+            self._entries[sector] = data
+        return data
+
+    def put(self, sector, data):
+        old = self._entries.pop(sector, None)
+        if old is not None:
+            self.size -= len(old)
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        self._entries[sector] = data
+        self.size += len(data)
+        if self.max_bytes is not None:
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def discard(self, sector):
+        old = self._entries.pop(sector, None)
+        if old is not None:
+            self.size -= len(old)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class SectorCache(object):
+    """
+    The default sector cache used by sources. Metadata sectors (volume descriptors, path tables,
+    directory extents and continuation areas) and content sectors are kept in separate LRU
+    segments, so that reading file content can't evict the directory structure.
+
+    max_bytes:
+      Byte budget for metadata sectors, or None for no limit.
+
+    max_content_bytes:
+      Byte budget for content sectors, or None for no limit. Content sectors are only offered to
+      the cache when the source was created with ``cache_content=True``.
+
+    Any object with the same ``__contains__``, ``get``, ``put`` and ``clear`` methods may be passed
+    to a source in its place.
+    """
+    def __init__(self, max_bytes=None, max_content_bytes=None):
+        self.metadata = LRUSegment(max_bytes)
+        self.content = LRUSegment(max_content_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.metadata) + len(self.content)
+
+    def __contains__(self, sector):
+        return sector in self.metadata or sector in self.content
+
+    def get(self, sector):
+        """
+        Returns the data for the given sector, or None if it isn't cached.
+        """
+        data = self.metadata.get(sector)
+        if data is None:
+            data = self.content.get(sector)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, sector, data, is_content=False):
+        if is_content:
+            if sector not in self.metadata:
+                self.content.put(sector, data)
+        else:
+            self.content.discard(sector)
+            self.metadata.put(sector, data)
+
+    def clear(self):
+        self.metadata.clear()
+        self.content.clear()
+
+    @property
+    def evictions(self):
+        return self.metadata.evictions + self.content.evictions
+
+    @property
+    def size(self):
+        return self.metadata.size + self.content.size
+
+    @property
+    def stats(self):
+        """
+        A dict of counters: cache hits, misses and evictions, and the number of bytes currently
+        held for metadata and content sectors.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'metadata_bytes': self.metadata.size,
+            'content_bytes': self.content.size,
+        }
+
+
+class DiskCache(object):
+    """
+    A persistent cache of an image's sectors on local disk, which may be shared by any number of
+    processes. It's made of two files in the given directory, named after a digest of the key: a
+    sparse copy of the image, and a bitmap with a bit set for each sector present in the copy.
+
+    Sectors are written to the copy before their bits are set, and the bitmap is only updated
+    under an exclusive ``lockf()`` lock (where available), so concurrent readers never see a bit
+    set for a sector that isn't there yet.
+    """
+    def __init__(self, directory, key, size, sector_length):
+        self.sector_length = sector_length
+        self.size = size
+        name = hashlib.sha1(key.encode('utf8')).hexdigest()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._data = self._open(os.path.join(directory, name + '.img'))
+        self._map = self._open(os.path.join(directory, name + '.map'))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _open(path):
+        # Never truncate, as another process may be creating or filling the same file. Both files
+        # start out empty, and sectors and bits past the end of either read as absent. They're
+        # unbuffered, as a buffer would keep serving bytes other processes have since replaced.
+        return io.open(os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666),
+                       'r+b', 0)
+
+    @staticmethod
+    def _write_all(f, data):
+        data = memoryview(data)
+        while len(data):
+            data = data[f.write(data):]
+
+    def _lockf(self, exclusive):
+        if fcntl is not None:
+            fcntl.lockf(self._map, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unlockf(self):
+        if fcntl is not None:
+            fcntl.lockf(self._map, fcntl.LOCK_UN)
+
+    def _read_bits(self, first, last):
+        self._map.seek(first // 8)
+        bits = bytearray(last // 8 - first // 8 + 1)
+        got = 0
+        while got < len(bits):
+            n = self._map.readinto(memoryview(bits)[got:])
+            if not n:
+                # Bytes past the end of the bitmap are unset
+                break
+            got += n
+        return bits
+
+    def read_into(self, sector, buff):
+        """
+        Fills the buffer from the given sector if every sector it covers is present, and returns
+        the number of bytes read. Returns None if any sector is missing.
+        """
+        count = 1 + (len(buff) - 1) // self.sector_length
+        end = min(len(buff), self.size - sector * self.sector_length)
+        if end <= 0:
+            return 0
+        with self._lock:
+            self._lockf(False)
+            try:
+                bits = self._read_bits(sector, sector + count - 1)
+            finally:
+                self._unlockf()
+            base = sector // 8 * 8
+            for s in range(sector, sector + count):
+                if not bits[(s - base) // 8] & (1 << (s % 8)):
+                    return None
+            self._data.seek(sector * self.sector_length)
+            buff = memoryview(buff)
+            got = 0
+            while got < end:
+                n = self._data.readinto(buff[got:end])
+                if not n:
+                    break
+                got += n
+            return got
+
+    def write(self, sector, data):
+        """
+        Stores data read from the given sector.
+        """
+        if not len(data):
+            return
+        count = 1 + (len(data) - 1) // self.sector_length
+        with self._lock:
+            self._data.seek(sector * self.sector_length)
+            self._write_all(self._data, data)
+            self._lockf(True)
+            try:
+                bits = self._read_bits(sector, sector + count - 1)
+                base = sector // 8 * 8
+                for s in range(sector, sector + count):
+                    bits[(s - base) // 8] |= 1 << (s % 8)
+                self._map.seek(sector // 8)
+                self._write_all(self._map, bits)
+            finally:
+                self._unlockf()
+
+    def close(self):
+        self._data.close()
+        self._map.close()
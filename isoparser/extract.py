@@ -0,0 +1,154 @@
+"""
+Bulk extraction.
+
+The records to extract are collected first, then file content is read in order of extent location,
+so that the image is read in one sequential sweep however its directories are laid out. With
+several workers, each copies a contiguous span of that order. Rock Ridge modes, symlinks and
+modification times are restored where present.
+
+Names are untrusted. Children with unsafe or repeated names are skipped, files are created afresh
+without following symlinks, and symlinks are created last, so that no symlink from the image can
+redirect a write outside the destination.
+"""
+import os
+import sys
+
+def _fsencode(path):
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding())
+
+
+_O_CREATE = (os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_NOFOLLOW', 0) |
+             getattr(os, 'O_BINARY', 0))
+
+
+def _safe_name(name):
+    return name not in (b"", b".", b"..") and b"/" not in name and b"\x00" not in name
+
+
+def collect(iso, paths=None):
+    """
+    Returns lists of (path, record) pairs for the directories, files and symlinks to extract from
+    the given paths (tuples of name components), or the whole image if ``paths`` is None. Each
+    path includes its final component; the root's path is the empty tuple. Children with unsafe
+    names, such as ``..``, are skipped, as are children named the same as an earlier child of the
+    same directory.
+    """
+    directories, files, symlinks = [], [], []
+    seen = set()
+    pending = [(tuple(path), iso.record(*path)) for path in (paths or [()])]
+    while pending:
+        path, record = pending.pop()
+        if (path, record.location) in seen:
+            continue
+        seen.add((path, record.location))
+        if record.rock_ridge.symlink is not None:
+            symlinks.append((path, record))
+        elif record.is_directory:
+            directories.append((path, record))
+            names = set()
+            for child in record.children:
+                if _safe_name(child.name) and child.name not in names:
+                    names.add(child.name)
+                    pending.append((path + (child.name,), child))
+        else:
+            files.append((path, record))
+    return directories, files, symlinks
+
+
+def _times(record):
+    rock_ridge = record.rock_ridge
+    mtime = rock_ridge.timestamps.get('modify')
+    if mtime is None:
+        mtime = record.timestamp
+    atime = rock_ridge.timestamps.get('access')
+    if atime is None:
+        atime = mtime
+    return atime, mtime
+
+
+def _restore(path, record, is_symlink=False):
+    if is_symlink:
+        if os.utime in getattr(os, 'supports_follow_symlinks', ()):
+            os.utime(path, _times(record), follow_symlinks=False)
+        return
+    if os.path.islink(path):
+        # Never follow a symlink in place of what was extracted
+        return
+    mode = record.rock_ridge.mode
+    if mode is not None:
+        os.chmod(path, mode & 0o7777)
+    os.utime(path, _times(record))
+
+
+def _unlink(path):
+    if os.path.lexists(path) and (os.path.islink(path) or not os.path.isdir(path)):
+        os.unlink(path)
+
+
+def _copy_files(files):
+    by_fd = hasattr(os, 'fchmod') and os.utime in getattr(os, 'supports_fd', ())
+    for dest, record in files:
+        # Replace whatever is already there, without following symlinks
+        _unlink(dest)
+        with os.fdopen(os.open(dest, _O_CREATE, 0o666), 'wb') as out:
+            record._source.copy_to(record.location, record.length, out)
+            out.flush()
+            if by_fd:
+                # Restore through the open file, so that no path is followed
+                mode = record.rock_ridge.mode
+                if mode is not None:
+                    os.fchmod(out.fileno(), mode & 0o7777)
+                os.utime(out.fileno(), _times(record))
+        if not by_fd:
+            _restore(dest, record)
+
+
+def extract(iso, dest, paths=None, workers=1):
+    """
+    Extracts the given paths from the ISO, or the whole image if ``paths`` is None, into the
+    directory ``dest``. Each path is recreated relative to ``dest``. File content is copied in order
+    of extent location, split between ``workers`` threads.
+    """
+    dest = _fsencode(dest)
+    directories, files, symlinks = collect(iso, paths)
+
+    def target(path):
+        return os.path.join(dest, *path) if path else dest
+
+    directories.sort(key=lambda item: item[0])
+    for path, _ in directories:
+        if path and os.path.islink(target(path)):
+            os.unlink(target(path))
+        if not os.path.isdir(target(path)):
+            os.makedirs(target(path))
+
+    files = sorted(((target(path), record) for path, record in files),
+                   key=lambda item: item[1].location)
+    for path, _ in files:
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+    if workers > 1 and len(files) > 1:
+        span = -(-len(files) // workers)
+        from concurrent import futures
+        with futures.ThreadPoolExecutor(workers) as executor:
+            for _ in executor.map(_copy_files, [files[i:i + span]
+                                                for i in range(0, len(files), span)]):
+                pass
+    else:
+        _copy_files(files)
+
+    # Symlinks go last, as no more files are written through the tree
+    for path, record in symlinks:
+        parent = os.path.dirname(target(path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        _unlink(target(path))
+        os.symlink(record.rock_ridge.symlink, target(path))
+        _restore(target(path), record, is_symlink=True)
+
+    # Restore directories deepest first, as creating their children updates their mtimes
+    for path, record in reversed(directories):
+        _restore(target(path), record)
@@ -0,0 +1,120 @@
+"""
+Sidecar metadata indexes.
+
+An index holds a copy of every sector an ISO's metadata lives in: the volume descriptors, the path
+tables, every directory extent (of the Joliet hierarchy too) and every SUSP continuation area. Loading an index pins those
+sectors in the source, so that listing directories, resolving paths and decoding Rock Ridge
+attributes never reads them from the image again. Only file content is read from the image.
+
+An index is keyed by the image size and a digest of its primary volume descriptor, and is ignored
+if either doesn't match.
+"""
+import hashlib
+import struct
+import zlib
+
+from . import susp
+from .source import SECTOR_LENGTH, _tobytes
+
+
+MAGIC = b'ISOPIDX\x01'
+
+_HEADER = struct.Struct('<8sQ20s')  # magic, image size, PVD digest
+_RUN = struct.Struct('<II')  # first sector, byte length
+
+
+def image_key(source):
+    """
+    Returns the (image size, PVD digest) pair that identifies an image.
+    """
+    pvd = source.read_at(16 * SECTOR_LENGTH, SECTOR_LENGTH)
+    return source.size, hashlib.sha1(pvd).digest()
+
+
+def metadata_extents(iso):
+    """
+    Yields (sector, length) pairs for every extent holding the ISO's metadata.
+    """
+    pvd = iso.volume_descriptors['primary']
+    yield 16, (iso._vd_end_sector - 16) * SECTOR_LENGTH
+    if iso.path_table is not None:
+        yield iso.path_table.location, pvd.path_table_size
+    directories = [pvd.root_record]
+    if iso.joliet_vd is not None:
+        if iso.joliet_path_table is not None:
+            yield iso.joliet_path_table.location, iso.joliet_vd.path_table_size
+        directories.append(iso.joliet_vd.root_record)
+
+    seen = set()
+    while directories:
+        directory = directories.pop()
+        if directory.location in seen:
+            continue
+        seen.add(directory.location)
+        yield directory.location, directory.length
+
+        for record in [directory.current_directory] + directory.children:
+            for entry in record.susp_entries_unsafe:
+                if isinstance(entry, susp.CE):
+                    yield entry.location, entry.offset + entry.length
+            if record.is_directory and record.location not in seen:
+                directories.append(record)
+
+
+def metadata_runs(iso):
+    """
+    Returns a sorted list of (first sector, sector count) runs covering all metadata extents.
+    """
+    runs = []
+    extents = sorted((sector, 1 + (max(length, 1) - 1) // SECTOR_LENGTH)
+                     for sector, length in metadata_extents(iso))
+    for sector, count in extents:
+        if runs and sector <= runs[-1][0] + runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], sector + count - runs[-1][0])
+        else:
+            runs.append([sector, count])
+    return runs
+
+
+def build(iso, path):
+    """
+    Sweeps the ISO's metadata and writes an index of it to the given path.
+    """
+    source = iso._source
+    size, digest = image_key(source)
+    payload = []
+    for sector, count in metadata_runs(iso):
+        data = source.read_sectors(sector, count * SECTOR_LENGTH, is_content=True)
+        payload.append(_RUN.pack(sector, len(data)))
+        payload.append(_tobytes(data))
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, size, digest))
+        f.write(zlib.compress(b''.join(payload)))
+
+
+def load(source, path):
+    """
+    Pins the sectors held in the index at the given path in the source. Returns False, leaving
+    the source untouched, if the index is missing, malformed, or for a different image.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, size, digest = _HEADER.unpack_from(data)
+        if magic != MAGIC or (size, digest) != image_key(source):
+            return False
+        payload = zlib.decompress(data[_HEADER.size:])
+    except (IOError, OSError, struct.error, zlib.error):
+        return False
+
+    sectors = {}
+    offset = 0
+    while offset < len(payload):
+        sector, length = _RUN.unpack_from(payload, offset)
+        offset += _RUN.size
+        for start in range(0, length, SECTOR_LENGTH):
+            sectors[sector + start // SECTOR_LENGTH] = payload[
+                offset + start:offset + min(start + SECTOR_LENGTH, length)]
+        offset += length
+    source.pinned.update(sectors)
+    return True
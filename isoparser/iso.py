@@ -1,41 +1,152 @@
-from . import susp, rockridge
+import collections
+import heapq
+import threading
+
+from . import cache, extract as extract_module, index as index_module, \
+    manifest as manifest_module, record as record_module, refs, source as source_module, susp, \
+    rockridge
+
+# Stands for a path table not yet read, as None stands for one that couldn't be
+_UNREAD = object()
 
 
 class ISO(object):
-    def __init__(self, source):
+    def __init__(self, source, name_index_size=1 << 16, index=None, joliet=None, lazy=False,
+                 image=None):
         self._source = source
+        self.image = image
 
-        # Unpack volume descriptors
-        self.volume_descriptors = {}
-        sector = 16
-        while True:
-            self._source.seek(sector)
-            sector += 1
-
-            vd = self._source.unpack_volume_descriptor()
-            self.volume_descriptors[vd.name] = vd
-
-            if vd.name == "terminator":
-                break
-
-        # Unpack the path table
-        self._source.seek(
-            self.volume_descriptors['primary'].path_table_l_loc,
-            self.volume_descriptors['primary'].path_table_size)
-        self.path_table = self._source.unpack_path_table()
-
-        # Save a reference to the root record
-        self.root = self.volume_descriptors['primary'].root_record
-
-        # Check to see if SUSP is enabled
-        root_record = self.root.current_directory
-        if root_record.embedded_susp_entries and isinstance(root_record.embedded_susp_entries[0], susp.SP):
-            self._source.susp_starting_index = root_record.embedded_susp_entries[0].len_skp
-            self._source.susp_extensions = [e for e in root_record.susp_entries if isinstance(e, susp.ER)]
-            if any(((er.ext_id, er.ext_ver) in rockridge.EXT_VERSIONS) for er in self._source.susp_extensions):
-                self._source.rockridge = True
-        else:
-            self._source.susp_starting_index = False
+        # Pin the metadata sectors held in a sidecar index, if it's valid for this image
+        if index is not None:
+            index_module.load(self._source, index)
+
+        # Directory location -> {child name: child record}, bounded by the total number of
+        # children held
+        self._name_indexes = cache.LRUSegment(name_index_size)
+        self._name_indexes_lock = threading.Lock()
+
+        self._joliet_requested = joliet
+        self._lock = threading.RLock()
+        self._volume_descriptors = None
+        self._joliet_vd = None
+        self._path_table = _UNREAD
+        self._joliet_path_table = _UNREAD
+        self._root = None
+        self._joliet = None
+
+        # In lazy mode, decode just the primary volume descriptor, which is almost always the
+        # first, from a single sector. Everything else is read on first use.
+        self.primary_vd = None
+        if lazy:
+            vd = self._source.buffer_from(
+                self._source.read_at(16 * source_module.SECTOR_LENGTH,
+                                     source_module.SECTOR_LENGTH)).unpack_volume_descriptor()
+            if vd.name == "primary":
+                self.primary_vd = vd
+                return
+        self._read_volume_descriptors()
+        if not lazy:
+            # Read the path table and check for SUSP up front
+            self.path_table
+            self._probe()
+
+    def _read_volume_descriptors(self):
+        with self._lock:
+            if self._volume_descriptors is not None:
+                return
+            volume_descriptors = {}
+            sector = 16
+            while True:
+                if sector == 16 and self.primary_vd is not None:
+                    vd = self.primary_vd
+                else:
+                    vd = self._source.buffer(sector).unpack_volume_descriptor()
+                sector += 1
+
+                volume_descriptors[vd.name] = vd
+                if vd.name == "supplementary" and vd.is_joliet and self._joliet_vd is None:
+                    self._joliet_vd = vd
+
+                if vd.name == "terminator":
+                    break
+            self._vd_end_sector = sector
+            self.primary_vd = volume_descriptors['primary']
+            self._volume_descriptors = volume_descriptors
+
+    def _probe(self):
+        """
+        Checks the root directory for SUSP and Rock Ridge, then chooses the hierarchy to use.
+        """
+        with self._lock:
+            if self._root is not None:
+                return
+            root = self.primary_vd.root_record
+
+            # Check to see if SUSP is enabled
+            root_record = root.current_directory
+            if root_record.embedded_susp_entries and isinstance(root_record.embedded_susp_entries[0], susp.SP):
+                self._source.susp_starting_index = root_record.embedded_susp_entries[0].len_skp
+                self._source.susp_extensions = [e for e in root_record.susp_entries if isinstance(e, susp.ER)]
+                if any(((er.ext_id, er.ext_ver) in rockridge.EXT_VERSIONS) for er in self._source.susp_extensions):
+                    self._source.rockridge = True
+            else:
+                self._source.susp_starting_index = False
+
+            # Use the Joliet hierarchy for names if asked to, or by default if there's no Rock
+            # Ridge
+            joliet = self._joliet_requested
+            if joliet is None:
+                joliet = not self._source.rockridge
+            self._joliet = bool(joliet and self.joliet_vd)
+            if self._joliet:
+                root = self.joliet_vd.root_record
+            self._root = root
+
+    @property
+    def volume_descriptors(self):
+        """
+        A dict of the image's volume descriptors, keyed by name. They're read on first access if
+        the ISO was opened lazily.
+        """
+        self._read_volume_descriptors()
+        return self._volume_descriptors
+
+    @property
+    def joliet_vd(self):
+        """
+        The first Joliet supplementary volume descriptor, or None if there isn't one.
+        """
+        self._read_volume_descriptors()
+        return self._joliet_vd
+
+    @property
+    def path_table(self):
+        """
+        The path table of the primary hierarchy, or None if none of its copies could be read. It's
+        read on first access if the ISO was opened lazily.
+        """
+        if self._path_table is _UNREAD:
+            with self._lock:
+                if self._path_table is _UNREAD:
+                    self._path_table = self._read_path_table(self.primary_vd)
+        return self._path_table
+
+    @property
+    def root(self):
+        """
+        The root directory's record, in the Joliet hierarchy if it's in use. If the ISO was opened
+        lazily, the root directory is checked for SUSP and Rock Ridge on first access.
+        """
+        self._probe()
+        return self._root
+
+    @property
+    def joliet(self):
+        """
+        Whether the Joliet hierarchy is in use, rather than the primary hierarchy.
+        """
+        self._probe()
+        return self._joliet
 
     def __enter__(self):
         return self
@@ -46,41 +157,264 @@ class ISO(object):
     def close(self):
         self._source.close()
 
+    def build_index(self, path):
+        """
+        Reads all of the ISO's metadata in one sweep, and writes it to a sidecar index at the given
+        path. Passing the index to :func:`parse` when reopening the same image avoids reading any
+        metadata sectors from it. See :mod:`isoparser.index`.
+        """
+        index_module.build(self, path)
+
+    def extract(self, dest, paths=None, workers=1):
+        """
+        Extracts the given paths (tuples of name components), or the whole image, into the
+        directory ``dest``, restoring Rock Ridge modes, symlinks and modification times. File
+        content is read in order of its location in the image, by up to ``workers`` threads. See
+        :mod:`isoparser.extract`.
+        """
+        extract_module.extract(self, dest, paths, workers)
+
+    def manifest(self, algorithms=("sha256",), workers=1, chunk_size=1 << 20, top=()):
+        """
+        Yields a (path, size, digests) tuple for each file under the path ``top``, where
+        ``digests`` maps each of the given ``hashlib`` algorithm names to a hex digest. Files are
+        hashed in order of their location in the image, ``chunk_size`` bytes at a time, by up to
+        ``workers`` threads. See :mod:`isoparser.manifest`.
+        """
+        return manifest_module.manifest(self, algorithms, workers, chunk_size, top)
+
+    def read_many(self, records_or_paths, gap=None, workers=1):
+        """
+        Yields a (record, content) pair for each of the given file records, or paths given as
+        tuples of name components, in order of location in the image. Files at most ``gap``
+        sectors apart are read with a single fetch, and the fetches may be made by up to
+        ``workers`` threads at once. See :func:`source.Source.read_extents`.
+        """
+        records = collections.OrderedDict()
+        for item in records_or_paths:
+            record = item if isinstance(item, record_module.Record) else self.record(*item)
+            records.setdefault((record.location, record.length), []).append(record)
+        for extent, data in self._source.read_extents(list(records), gap, workers=workers):
+            for record in records[extent]:
+                yield record, data
+
+    def ref(self, record, parent=None):
+        """
+        Returns a picklable :class:`refs.RecordRef` for the given record, which may be resolved
+        back into a record in another process. ``parent`` is the record of the directory holding
+        it, if known. Only ISOs opened with :func:`parse` can make refs.
+        """
+        if self.image is None:
+            raise ValueError("Records can only be referenced in images opened with parse()")
+        return refs.RecordRef(self.image, record.location, record.length, record._flags,
+                              record._raw, None if parent is None else parent.location,
+                              isinstance(record, record_module.JolietRecord))
+
+    @property
+    def cache(self):
+        """
+        The source's sector cache. For the default :class:`cache.SectorCache`, its ``stats``
+        property reports hits, misses, evictions and bytes held.
+        """
+        return self._source.cache
+
+    @property
+    def stats(self):
+        """
+        A dict of the source's I/O counters (see :class:`stats.IOStats`), with the sector cache's
+        ``stats`` under ``cache`` where it has them.
+        """
+        stats = self._source.stats.as_dict()
+        stats['cache'] = getattr(self._source.cache, 'stats', None)
+        return stats
+
+    def advise(self, hint, records=()):
+        """
+        Advises the source of the reads to expect: ``'normal'``, ``'sequential'`` or ``'random'``
+        access, or ``'willneed'``, which reads ahead the extents of the given records. See
+        :func:`source.Source.advise`.
+        """
+        self._source.advise(hint, [(record.location, record.length) for record in records])
+
+    @property
+    def fetch_hook(self):
+        """
+        The source's fetch hook, called as ``hook(sector, count, duration)`` after every fetch from
+        the image. See :attr:`source.Source.fetch_hook`.
+        """
+        return self._source.fetch_hook
+
+    @fetch_hook.setter
+    def fetch_hook(self, hook):
+        self._source.fetch_hook = hook
+
     def record(self, *path):
         """
         Retrieves a record for the given path.
         """
-        record = None
-        if self._source.rockridge:
-            # In Rock Ridge mode, we can't use the path table
-            pivot = 0
-        else:
-            path = [part.upper() for part in path]
-            pivot = len(path)
-
+        path, pivot = self._path_table_prefix(path)
 
         # Resolve as much of the path as possible via the path table
-        while pivot > 0:
-            try:
-                record = self.path_table.record(*path[:pivot])
-            except KeyError:
-                pivot -= 1
-            else:
-                break
-
-        if record is None:
+        if pivot > 0:
+            record = self._lookup_path_table.record(*path[:pivot])
+        else:
             record = self.root
 
-        # Resolve the remainder of the path by walking record children
+        # Resolve the remainder of the path via the name indexes of each directory
         for part in path[pivot:]:
-            for child in record.children_unsafe:
-                # Must save the cursor since child.name can cause a seek
-                saved_cursor = self._source.save_cursor()
-                if child.name == part:
-                    record = child
-                    break
-                self._source.restore_cursor(saved_cursor)
-            else:
-                raise KeyError(part)
+            record = self._name_index(record)[part]
 
         return record
+
+    def walk(self, top=(), order="physical"):
+        """
+        Yields a (path, dirs, files) tuple for each directory under the path ``top``, in the
+        manner of ``os.walk()``. ``path`` is a tuple of name components, and ``dirs`` and ``files``
+        are lists of child records. Removing records from ``dirs`` stops them being visited.
+
+        With ``order="physical"`` (the default), directories are visited in order of their location
+        in the image, so that reads move forwards and sectors fetched as readahead are used. Only
+        the directories waiting to be visited are held in memory. With ``order="depth"``,
+        directories are visited depth first, in the order listed, as with ``os.walk()``.
+        """
+        if order not in ("physical", "depth"):
+            raise ValueError("Unknown walk order: %r" % (order,))
+        top = tuple(top)
+        record = self.record(*top)
+        pending = [(record.location, 0, top, record)]
+        counter = 1
+        while pending:
+            if order == "physical":
+                _, _, path, record = heapq.heappop(pending)
+            else:
+                _, _, path, record = pending.pop()
+            dirs, files = [], []
+            for child in record.children:
+                (dirs if child.is_directory else files).append(child)
+
+            yield path, dirs, files
+
+            children = dirs if order == "physical" else reversed(dirs)
+            for child in children:
+                entry = (child.location, counter, path + (child.name,), child)
+                counter += 1
+                if order == "physical":
+                    heapq.heappush(pending, entry)
+                else:
+                    pending.append(entry)
+
+    @property
+    def joliet_path_table(self):
+        """
+        The path table of the Joliet hierarchy, with names decoded to UTF-8, or None if the image
+        has no Joliet volume descriptor or none of the table's copies could be read. It's read on
+        first access.
+        """
+        if self.joliet_vd is None:
+            return None
+        if self._joliet_path_table is _UNREAD:
+            with self._lock:
+                if self._joliet_path_table is _UNREAD:
+                    self._joliet_path_table = self._read_path_table(self.joliet_vd, joliet=True)
+        return self._joliet_path_table
+
+    def _read_path_table(self, vd, joliet=False):
+        """
+        Reads the L-type path table of the given volume descriptor, falling back to the optional
+        L-type table, then the M-type tables, if it's missing or malformed. Returns None if none of
+        them can be read, in which case paths are resolved by walking directories from the root.
+        """
+        error = None
+        for location, big_endian in ((vd.path_table_l_loc, False),
+                                     (vd.path_table_opt_l_loc, False),
+                                     (vd.path_table_m_loc, True),
+                                     (vd.path_table_opt_m_loc, True)):
+            if location <= 0:
+                continue
+            try:
+                table = self._source.buffer(location, vd.path_table_size).unpack_path_table(
+                    joliet, big_endian)
+            except source_module.SourceError as e:
+                error = e
+                continue
+            table.location = location
+            return table
+        # Imported here, so that importing isoparser doesn't load logging
+        import logging
+        logging.getLogger(__name__).warning(
+            "Can't read a path table, walking directories instead: %s", error or "no path table")
+        return None
+
+    def directories(self):
+        """
+        Yields a (path, location) pair for every directory in the image, root first, in order of
+        depth, from the path table alone. Paths are those of the Joliet hierarchy if it's in use,
+        and otherwise of the primary hierarchy, whose names are not Rock Ridge names. If the path
+        table couldn't be read, directories are walked from the root instead, and paths are those
+        of :func:`record`.
+        """
+        table = self.joliet_path_table if self.joliet else self.path_table
+        if table is None:
+            return self._walk_directories()
+        return table.directories()
+
+    def _walk_directories(self):
+        pending = collections.deque([((), self.root)])
+        while pending:
+            path, directory = pending.popleft()
+            yield path, directory.location
+            for child in directory.children:
+                if child.is_directory:
+                    pending.append((path + (child.name,), child))
+
+    @property
+    def _lookup_path_table(self):
+        """
+        The path table :func:`record` resolves paths through, or None if it can't use one.
+        """
+        if self.joliet:
+            return self.joliet_path_table
+        if self._source.rockridge:
+            # Rock Ridge names aren't in the primary path table
+            return None
+        return self.path_table
+
+    def _path_table_prefix(self, path):
+        """
+        Returns the path, normalised for lookup, and the length of its longest prefix found in the
+        path table, not counting the last component. The last is always looked up in its parent's
+        name index, as the path table only leads to a directory's own "." record, which is unnamed.
+        """
+        table = self._lookup_path_table
+        if table is None:
+            return path, 0
+
+        if not self.joliet:
+            path = [part.upper() for part in path]
+        pivot = max(len(path) - 1, 0)
+        while pivot > 0 and tuple(path[:pivot]) not in table.paths:
+            pivot -= 1
+        return path, pivot
+
+    def _cached_name_index(self, record):
+        """
+        Returns the name index of the given directory record if it's kept, or None.
+        """
+        with self._name_indexes_lock:
+            return self._name_indexes.get(record.location)
+
+    def _name_index(self, record):
+        """
+        Returns a dict mapping child names to child records for the given directory record. The
+        dict covers every child, so a name missing from it is known not to exist without reading
+        the directory again. Recently used dicts are kept, up to ``name_index_size`` children in
+        total.
+        """
+        index = self._cached_name_index(record)
+        if index is None:
+            index = {}
+            for child in record.children:
+                index.setdefault(child.name, child)
+            with self._name_indexes_lock:
+                self._name_indexes.put(record.location, index)
+        return index
@@ -0,0 +1,75 @@
+"""
+Content manifests.
+
+Files are hashed in order of extent location, in fixed-size chunks read straight from the source,
+so memory use doesn't depend on file sizes. Files sharing an extent (hard links, or empty files)
+are hashed once. With several workers, files are hashed on a thread pool: ``hashlib`` releases the
+GIL while hashing, and sources read positionally, so each worker streams its own file
+independently.
+"""
+import collections
+import hashlib
+
+
+def _hash_extent(source, location, length, algorithms, chunk_size):
+    hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+    reader = source.open(location, length)
+    buff = memoryview(bytearray(max(1, min(chunk_size, length))))
+    try:
+        while True:
+            got = reader.readinto(buff)
+            if not got:
+                break
+            for h in hashes:
+                h.update(buff[:got])
+    finally:
+        reader.close()
+    return dict((algorithm, h.hexdigest()) for algorithm, h in zip(algorithms, hashes))
+
+
+def manifest(iso, algorithms=("sha256",), workers=1, chunk_size=1 << 20, top=()):
+    """
+    Yields a (path, size, digests) tuple for each file under the path ``top``, where ``digests``
+    maps each algorithm name to a hex digest. Files are yielded in order of their location in the
+    image.
+    """
+    algorithms = tuple(algorithms)
+    for algorithm in algorithms:
+        hashlib.new(algorithm)  # Fail early for unknown algorithms
+
+    extents = collections.defaultdict(list)
+    for path, _, files in iso.walk(top):
+        for record in files:
+            extents[record.location, record.length].append(path + (record.name,))
+    plan = sorted(extents.items())
+
+    def hash_extent(extent):
+        return _hash_extent(iso._source, extent[0], extent[1], algorithms, chunk_size)
+
+    if workers <= 1:
+        for extent, paths in plan:
+            digests = hash_extent(extent)
+            for path in paths:
+                yield path, extent[1], digests
+        return
+
+    # Keep a bounded window of extents in flight, yielding results in plan order
+    from concurrent import futures
+    with futures.ThreadPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        plan = iter(plan)
+
+        def submit():
+            item = next(plan, None)
+            if item is not None:
+                extent, paths = item
+                pending.append((executor.submit(hash_extent, extent), extent, paths))
+
+        for _ in range(2 * workers):
+            submit()
+        while pending:
+            future, extent, paths = pending.popleft()
+            digests = future.result()
+            submit()
+            for path in paths:
+                yield path, extent[1], digests
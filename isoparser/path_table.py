@@ -1,31 +1,127 @@
+import array
+import bisect
+import struct
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 from . import record
 
 
+# Fixed part of an L-type (little-endian) or M-type (big-endian) path table entry
+_ENTRY_L = struct.Struct('<BxIH')
+_ENTRY_M = struct.Struct('>BxIH')
+
+
+def _error(message):
+    # Imported here, as the source module imports this one, which Python 2 can't do at the top
+    from .source import SourceError
+    return SourceError(message)
+
+
 class PathTable(object):
-    def __init__(self, source):
-        self._source = source
-        self.paths = {}
+    """
+    A path table, which lists every directory in the hierarchy. Entries are held in table order
+    (by depth, then by parent) in compact arrays of locations and parent indexes, so the directory
+    tree can be queried without reading any directory extents.
+    """
+    def __init__(self, source, joliet=False, big_endian=False):
+        self._source = source.source
+        self._record_class = record.JolietRecord if joliet else None
+        self.location = None
 
-        paths_list = []
+        entry = _ENTRY_M if big_endian else _ENTRY_L
+        self._paths = []
+        self._locations = array.array('I')
+        self._parents = array.array('I')
+        self._index = {}
 
         while len(source) > 0:
-            name_length = source.unpack('B')
-            _           = source.unpack('B')
-            location    = source.unpack('<I')
-            parent_idx  = source.unpack('<H') - 1
-            name        = source.unpack_string(name_length)
+            name_length, location, parent_idx = source.unpack_struct(entry)
+            if name_length == 0:
+                # Zero padding at the end of the last sector
+                break
+            parent_idx -= 1
+            name        = source.unpack_bytes(name_length)
             _           = source.unpack_raw(name_length % 2)
 
-            path = []
-            if len(paths_list) > 0:
-                path.extend(paths_list[parent_idx])
-            if name != "\x00":
-                path.append(name)
+            # Entries are ordered by parent, and parents come before their children
+            index = len(self._paths)
+            if index == 0:
+                if parent_idx != 0 or name != b"\x00":
+                    raise _error(
+                        "Path table doesn't start with the root directory")
+                path = ()
+            else:
+                if not 0 <= parent_idx < index or parent_idx < self._parents[-1]:
+                    raise _error("Path table entries out of order")
+                if joliet:
+                    name = record.decode_joliet_name(name)
+                else:
+                    name = name.rstrip(b' ')
+                path = self._paths[parent_idx] + (name,)
+
+            self._paths.append(path)
+            self._locations.append(location)
+            self._parents.append(parent_idx)
+            self._index[path] = index
 
-            paths_list.append(path)
-            self.paths[tuple(path)] = location
+        if not self._paths:
+            raise _error("Empty path table")
+        self.paths = _Locations(self)
+
+    def __len__(self):
+        return len(self._paths)
 
     def record(self, *path):
         location = self.paths[path]
-        self._source.seek(location)
-        return self._source.unpack_record()
\ No newline at end of file
+        return self._source.buffer(location).unpack_record(self._record_class)
+
+    def directories(self):
+        """
+        Yields a (path, location) pair for every directory, root first, in order of depth.
+        """
+        for index, path in enumerate(self._paths):
+            yield path, self._locations[index]
+
+    def parent(self, *path):
+        """
+        Returns the path of the given directory's parent, or None for the root directory.
+        """
+        index = self._index[path]
+        if index == 0:
+            return None
+        return self._paths[self._parents[index]]
+
+    def children_dirs(self, *path):
+        """
+        Returns the paths of the given directory's subdirectories, in table order.
+        """
+        index = self._index[path]
+        # Children of a directory are contiguous, as entries are ordered by parent. The root is
+        # its own parent, so is skipped.
+        start = bisect.bisect_left(self._parents, index, 1)
+        end = bisect.bisect_right(self._parents, index, start)
+        return self._paths[start:end]
+
+
+class _Locations(Mapping):
+    """
+    A read-only mapping from directory paths to extent locations.
+    """
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, path):
+        return self._table._locations[self._table._index[path]]
+
+    def __contains__(self, path):
+        return path in self._table._index
+
+    def __iter__(self):
+        return iter(self._table._paths)
+
+    def __len__(self):
+        return len(self._table._paths)
@@ -0,0 +1,53 @@
+"""
+Adaptive readahead.
+
+Each source sizes its metadata reads, its cached content reads, and its HTTP content streams with
+a :class:`Readahead`, in the manner of the Linux kernel's readahead: the window grows while reads
+move forward through the image, such as a walk through directory extents or a file being
+streamed, and shrinks again on random access. Hints given to :func:`source.Source.advise` fix the
+window instead.
+"""
+
+NORMAL = 'normal'
+SEQUENTIAL = 'sequential'
+RANDOM = 'random'
+WILLNEED = 'willneed'
+
+HINTS = (NORMAL, SEQUENTIAL, RANDOM, WILLNEED)
+
+
+class Readahead(object):
+    """
+    Chooses how far to read for each of a stream of reads, in any unit (sectors or bytes).
+
+    The window starts at ``minimum``. A read starting where the previous one ended, or less than
+    a window beyond, is taken as sequential and doubles the window, up to ``maximum``. Any other
+    read halves it, down to ``minimum``. With a ``hint`` of ``'sequential'``, every read is
+    extended to ``maximum``; with ``'random'``, reads aren't extended at all.
+    """
+    def __init__(self, minimum, maximum, hint=NORMAL):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.hint = hint
+        self.window = minimum
+        self.position = None  # Where the previous read ended
+
+    def size(self, start, length):
+        """
+        Returns how much to read from ``start`` to satisfy a read of ``length``: at least
+        ``length``, plus any readahead. Assumes that much is read; set ``position`` to where the
+        read actually ended if it's cut short.
+        """
+        if self.hint == RANDOM:
+            size = length
+        elif self.hint == SEQUENTIAL:
+            size = max(length, self.maximum)
+        else:
+            if self.position is not None:
+                if 0 <= start - self.position <= self.window:
+                    self.window = min(self.window * 2, self.maximum)
+                else:
+                    self.window = max(self.window // 2, self.minimum)
+            size = max(length, self.window)
+        self.position = start + size
+        return size
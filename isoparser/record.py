@@ -1,30 +1,87 @@
+import io
+import operator
+import struct
+
+from six import indexbytes
+
 from . import susp, rockridge
 
+
+# Fixed part of a directory record, following the length byte
+_HEADER_LE = struct.Struct('<BI4xI4x7sBBBh2xB')
+_HEADER_BE = struct.Struct('>5xI4xI12xhx')
+_HEADER_BOTH = operator.itemgetter(1, 2, 7)
+
+
 class Record(object):
+    """
+    A directory record. Only the extent location, length and flags are decoded up front; the
+    record's raw bytes are kept, and its name, timestamp and embedded SUSP entries are decoded on
+    first access.
+    """
+    __slots__ = ('_source', '_raw', '_flags', '_susp_starting_index', '_datetime',
+                 '_embedded_susp_entries', '_rock_ridge', '_content', 'location', 'length')
+
     def __init__(self, source, length, susp_starting_index=None):
-        self._source = source
+        self._source = source.source
+        self._susp_starting_index = susp_starting_index
+        self._datetime = None
+        self._embedded_susp_entries = None
+        self._rock_ridge = None
         self._content = None
-        target = source.cursor + length
-
-        _                  = source.unpack('B')       # TODO: extended attributes length
-        self.location      = source.unpack_both('I')
-        self.length        = source.unpack_both('I')
-        self.datetime      = source.unpack_dir_datetime()
-        flags              = source.unpack('B')
-        self.is_hidden     = bool(flags & 1)
-        self.is_directory  = bool(flags & 2)
-        # TODO: other flags
-        _                  = source.unpack('B')       # TODO: interleave unit size
-        _                  = source.unpack('B')       # TODO: interleave gap size
-        _                  = source.unpack_both('h')  # TODO: volume sequence
-        name_length        = source.unpack('B')
-        self.raw_name      = source.unpack_string(name_length).split(b';')[0]
-        if self.raw_name == b"\x00":
-            self.raw_name = b""
-        if name_length % 2 == 0:
-            source.unpack_raw(1) # Parity padding
-
-        # System-use area
+
+        # TODO: extended attributes length, interleave unit size, interleave gap size, volume sequence
+        _, self.location, self.length, _, self._flags, _, _, _, _ = \
+            source.unpack_both_struct(_HEADER_LE, _HEADER_BE, _HEADER_BOTH)
+        source.rewind_raw(_HEADER_LE.size)
+        self._raw = source.unpack_bytes(length)
+
+    @property
+    def is_hidden(self):
+        return bool(self._flags & 1)
+
+    @property
+    def is_directory(self):
+        return bool(self._flags & 2)
+
+    # TODO: other flags
+
+    @property
+    def datetime(self):
+        if self._datetime is None:
+            self._datetime = self._source.decode_dir_datetime(self._raw[17:24])
+        return self._datetime
+
+    @property
+    def timestamp(self):
+        """
+        The recording date and time as a POSIX timestamp.
+        """
+        return self._source.decode_dir_timestamp(self._raw[17:24])
+
+    @property
+    def raw_name(self):
+        name_length = indexbytes(self._raw, 31)
+        raw_name = self._raw[32:32 + name_length].rstrip(b' ').split(b';')[0]
+        if raw_name == b"\x00":
+            raw_name = b""
+        return raw_name
+
+    @property
+    def embedded_susp_entries(self):
+        """
+        This property is a list of the SUSP entries embedded in the record's system-use area.
+        """
+        if self._embedded_susp_entries is None:
+            self._embedded_susp_entries = self._unpack_embedded_susp_entries()
+        return self._embedded_susp_entries
+
+    def _unpack_embedded_susp_entries(self):
+        name_length = indexbytes(self._raw, 31)
+        source = self._source.buffer_from(self._raw, 32 + name_length + (1 - name_length % 2))
+        target = len(self._raw)
+        susp_starting_index = self._susp_starting_index
+
         susp_entries = []
         if susp_starting_index is None:
             try_susp = source.unpack_susp(target - source.cursor)
@@ -45,10 +102,8 @@ class Record(object):
                     # "Stop" entry
                     break
 
-        self.embedded_susp_entries = susp_entries
-
         assert source.cursor <= target
-        source.unpack_raw(target - source.cursor)
+        return susp_entries
 
     def __repr__(self):
         return "<Record (%s) name=%r>" % (
@@ -57,21 +112,36 @@ class Record(object):
 
     @property
     def name(self):
-        name = b""
-        for entry in self.susp_entries_unsafe:
-            if not isinstance(entry, rockridge.NM):
-                continue
-            name += entry.name
-            if entry.flags & rockridge.NM.CONTINUE == 0:
-                break
-        return name or self.raw_name
+        if not self.embedded_susp_entries:
+            return self.raw_name
+        return self.rock_ridge.name or self.raw_name
+
+    @property
+    def rock_ridge(self):
+        """
+        This property is a :class:`rockridge.Attributes` object holding the record's Rock Ridge
+        name, mode, ownership, timestamps, symlink target and device number. It's decoded from the
+        record's SUSP entries, including any in continuation areas, on first access.
+        """
+        if self._rock_ridge is None:
+            self._rock_ridge = rockridge.Attributes(self.susp_entries_unsafe)
+        return self._rock_ridge
+
+    @property
+    def continuation_areas(self):
+        """
+        This property is a list of (sector, length) extents of the SUSP continuation areas
+        referenced by the record's embedded entries.
+        """
+        return [(entry.location, entry.offset + entry.length)
+                for entry in self.embedded_susp_entries if isinstance(entry, susp.CE)]
 
     @property
     def susp_entries_unsafe(self):
         """
-        This generator yields a record for each SUSP entry associated with this record. As with
-        children_unsafe, the generator assumes that the source cursor has not moved since the
-        previous child was yielded. For safer behaviour, use :func:`susp_entries`.
+        This generator yields a record for each SUSP entry associated with this record. Entries
+        in continuation areas are read from private buffers, so the generator is safe to interleave
+        with other reads; the name is kept for compatibility.
         """
 
         embedded_iter = iter(self.embedded_susp_entries)
@@ -86,14 +156,14 @@ class Record(object):
                     embedded_iter = None
                     continue
             elif target:
-                entry = self._source.unpack_susp(target - self._source.cursor)
+                entry = ce_buff.unpack_susp(target - ce_buff.cursor)
                 if not entry:
                     target = None
                     continue
             elif ce_entry:
-                self._source.seek(ce_entry.location, ce_entry.offset + ce_entry.length)
-                self._source.unpack_raw(ce_entry.offset)
-                target = self._source.cursor + ce_entry.length
+                ce_buff = self._source.buffer(ce_entry.location, ce_entry.offset + ce_entry.length)
+                ce_buff.unpack_raw(ce_entry.offset)
+                target = ce_buff.cursor + ce_entry.length
                 ce_entry = None
                 continue
 
@@ -128,19 +198,19 @@ class Record(object):
     @property
     def children_unsafe(self):
         """
-        Assuming this is a directory record, this generator yields a record for each child. Use
-        with caution: at each iteration, the generator assumes that the source cursor has not moved
-        since the previous child was yielded. For safer behaviour, use :func:`children`.
+        Assuming this is a directory record, this generator yields a record for each child. The
+        directory extent is read into a private buffer, so the generator is safe to interleave with
+        other reads; the name is kept for compatibility.
         """
         assert self.is_directory
-        self._source.seek(self.location, self.length)
-        _ = self._source.unpack_record()  # current directory
-        _ = self._source.unpack_record()  # parent directory
-        while len(self._source) > 0:
-            record = self._source.unpack_record()
+        buff = self._source.buffer(self.location, self.length)
+        _ = buff.unpack_record(type(self))  # current directory
+        _ = buff.unpack_record(type(self))  # parent directory
+        while len(buff) > 0:
+            record = buff.unpack_record(type(self))
 
             if record is None:
-                self._source.unpack_boundary()
+                buff.unpack_boundary()
                 continue
 
             yield record
@@ -148,9 +218,24 @@ class Record(object):
     @property
     def children(self):
         """
-        Assuming this is a directory record, this property contains records for its children.
+        Assuming this is a directory record, this property contains records for its children. The
+        SUSP continuation areas of all the children are read in one batch, with readahead, as
+        areas tend to be laid out together.
+        """
+        children = list(self.children_unsafe)
+        areas = [area for child in children for area in child.continuation_areas]
+        if areas:
+            self._source.prefetch(areas, readahead=True)
+        return children
+
+    def prefetch_children(self):
+        """
+        Assuming this is a directory record, reads the extents of all of its child directories into
+        the sector cache in one batch, so that listing them doesn't need a fetch each. Over HTTP,
+        the fetches are made concurrently.
         """
-        return list(self.children_unsafe)
+        self._source.prefetch((child.location, child.length)
+                              for child in self.children_unsafe if child.is_directory)
 
     @property
     def current_directory(self):
@@ -159,8 +244,7 @@ class Record(object):
         current directory ("." in Unix parlance, "" in ISO9660).
         """
         assert self.is_directory
-        self._source.seek(self.location, self.length)
-        return self._source.unpack_record()  # current directory
+        return self._source.buffer(self.location, self.length).unpack_record(type(self))
 
     @property
     def parent_directory(self):
@@ -169,9 +253,9 @@ class Record(object):
         parent directory (".." in Unix parlance, "\\x01" in ISO9660).
         """
         assert self.is_directory
-        self._source.seek(self.location, self.length)
-        _ = self._source.unpack_record()  # current directory
-        return self._source.unpack_record()  # parent directory
+        buff = self._source.buffer(self.location, self.length)
+        _ = buff.unpack_record(type(self))  # current directory
+        return buff.unpack_record(type(self))  # parent directory
 
     @property
     def content(self):
@@ -180,8 +264,7 @@ class Record(object):
         """
         assert not self.is_directory
         if self._content is None:
-            self._source.seek(self.location, self.length, is_content=True)
-            self._content = self._source.unpack_all()
+            self._content = self._source.read_content(self.location, self.length)
         return self._content
 
     def get_stream(self):
@@ -192,5 +275,47 @@ class Record(object):
         assert not self.is_directory
         return self._source.get_stream(self.location, self.length)
 
+    def open(self, readahead=1 << 17):
+        """
+        Assuming this is a file record, returns a seekable binary file object over its content.
+        Content is read from the source as needed rather than held in memory, and reads smaller than
+        ``readahead`` bytes are served from a buffer of that size. If ``readahead`` is 0, the file
+        object is unbuffered.
+        """
+        assert not self.is_directory
+        raw = self._source.open(self.location, self.length)
+        if not readahead:
+            return raw
+        return io.BufferedReader(raw, readahead)
+
+
+class JolietRecord(Record):
+    """
+    A directory record in a Joliet hierarchy. Names are stored as UCS-2, and are decoded and
+    returned as UTF-8 bytes. Joliet records carry no SUSP entries.
+    """
+    __slots__ = ()
+
+    def __init__(self, source, length, susp_starting_index=None):
+        super(JolietRecord, self).__init__(source, length, False)
+
+    @property
+    def raw_name(self):
+        name_length = indexbytes(self._raw, 31)
+        raw_name = self._raw[32:32 + name_length]
+        if raw_name in (b"\x00", b"\x01"):
+            return b""
+        return decode_joliet_name(raw_name)
+
+    @property
+    def name(self):
+        return self.raw_name
 
 
+def decode_joliet_name(raw_name):
+    """
+    Decodes a UCS-2 Joliet file or directory identifier to UTF-8 bytes, dropping any version
+    number.
+    """
+    name = raw_name.decode('utf-16-be', 'replace').split(';')[0]
+    return name.encode('utf-8')
@@ -0,0 +1,123 @@
+"""
+Picklable record handles.
+
+A :class:`Record` holds its source, so it can't be sent to another process. A :class:`RecordRef`
+holds just enough to rebuild it without reading any directories: the identifier of the image it
+came from, and the record's raw bytes, from which its name and SUSP entries are decoded again.
+Scan an image once in the parent process with :func:`ISO.ref`, send the refs to a process pool,
+and :func:`resolve` them there::
+
+    def digest(ref):
+        return hashlib.sha256(refs.resolve(ref).content).hexdigest()
+
+    with isoparser.parse(path) as iso:
+        files = [iso.ref(record) for _, _, records in iso.walk() for record in records]
+    with ProcessPoolExecutor() as executor:
+        for ref, hexdigest in zip(files, executor.map(digest, files)):
+            ...
+
+Each process opens each image once, lazily, through a :class:`Registry`. Images opened in a
+parent process are not reused by forked children.
+"""
+import collections
+import os
+import threading
+
+from . import record as record_module
+
+
+class RecordRef(collections.namedtuple('RecordRef',
+                                        'image location length flags raw parent joliet')):
+    """
+    A picklable reference to a record.
+
+    image:
+      The identifier of the image, as ``ISO.image``: the path or URL it was opened from, and the
+      options it was opened with.
+
+    location, length, flags:
+      The record's extent location and length, and its file flags.
+
+    raw:
+      The raw bytes of the directory record, following its length byte.
+
+    parent:
+      The extent location of the directory holding the record, or None if unknown.
+
+    joliet:
+      Whether the record is from the Joliet hierarchy.
+    """
+    __slots__ = ()
+
+    @property
+    def is_directory(self):
+        return bool(self.flags & 2)
+
+    def resolve(self, registry=None):
+        """
+        Returns the :class:`Record` this refers to, opening its image through the given registry,
+        or this process's default registry.
+        """
+        return (registry or _registry).resolve(self)
+
+
+class Registry(object):
+    """
+    The images opened in one process, keyed by identifier. Each is opened the first time a ref to
+    it is resolved, with ``lazy=True``, so that no more than the primary volume descriptor and
+    root directory are read before decoding records. A registry inherited by a forked child
+    starts afresh.
+    """
+    def __init__(self):
+        self._isos = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def get(self, image):
+        """
+        Returns the ISO for the given image identifier, opening it if needed.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Don't share file offsets or connections with the parent process
+                self._isos = {}
+                self._pid = os.getpid()
+            iso = self._isos.get(image)
+            if iso is None:
+                from . import parse
+                path_or_url, options = image
+                options = dict(options)
+                options['lazy'] = True
+                iso = self._isos[image] = parse(path_or_url, **options)
+        return iso
+
+    def resolve(self, ref):
+        """
+        Returns the :class:`Record` for the given :class:`RecordRef`.
+        """
+        iso = self.get(ref.image)
+        source = iso._source
+        # Records are decoded according to the image's SUSP settings, so check for them first
+        iso._probe()
+        record_class = record_module.JolietRecord if ref.joliet else record_module.Record
+        return record_class(source.buffer_from(ref.raw), len(ref.raw), source.susp_starting_index)
+
+    def close(self):
+        """
+        Closes every image opened.
+        """
+        with self._lock:
+            isos, self._isos = self._isos, {}
+        for iso in isos.values():
+            iso.close()
+
+
+_registry = Registry()
+
+
+def resolve(ref):
+    """
+    Returns the :class:`Record` for the given :class:`RecordRef`, opening its image in this
+    process if it isn't already open.
+    """
+    return _registry.resolve(ref)
@@ -80,7 +80,7 @@ class SL(SUSP_Entry):
         while source.cursor < target:
             comp_flags   = source.unpack('B')
             comp_len     = source.unpack('B')
-            comp_content = source.unpack_raw(comp_len)
+            comp_content = source.unpack_bytes(comp_len)
             susp_assert(source.cursor <= target)
             if comp_flags == SL.CURRENT:
                 susp_assert(comp_len == 0)
@@ -122,7 +122,7 @@ class NM(SUSP_Entry):
         super(NM, self).__init__(source, ext_id_ver, sig_version, length)
         susp_assert(length >= 1)
         self.flags = source.unpack('B')
-        name_content = source.unpack_raw(length - 1)
+        name_content = source.unpack_bytes(length - 1)
         if self.flags == NM.CURRENT:
             susp_assert(length == 1)
             self.name = "."
@@ -155,14 +155,70 @@ class TF(SUSP_Entry):
         susp_assert(length >= 1)
         self.flags = source.unpack('B')
         if self.flags & TF.LONG_FORM:
-            unpack_datetime = source.unpack_vd_datetime
+            date_length = 17
+            decode_datetime = bytes
+            decode_timestamp = source.decode_vd_timestamp
         else:
-            unpack_datetime = source.unpack_dir_datetime
-
-        self.creation   = unpack_datetime() if self.flags & TF.CREATION else None
-        self.modify     = unpack_datetime() if self.flags & TF.MODIFY else None
-        self.access     = unpack_datetime() if self.flags & TF.ACCESS else None
-        self.attributes = unpack_datetime() if self.flags & TF.ATTRIBUTES else None
-        self.backup     = unpack_datetime() if self.flags & TF.BACKUP else None
-        self.expiration = unpack_datetime() if self.flags & TF.EXPIRATION else None
-        self.effective  = unpack_datetime() if self.flags & TF.EFFECTIVE else None
+            date_length = 7
+            decode_datetime = source.decode_dir_datetime
+            decode_timestamp = source.decode_dir_timestamp
+
+        self._timestamps = {}
+        for flag, field in TF._FIELDS:
+            if self.flags & flag:
+                date = source.unpack_bytes(date_length)
+                setattr(self, field, decode_datetime(date))
+                self._timestamps[field] = decode_timestamp(date)
+            else:
+                setattr(self, field, None)
+
+    def timestamp(self, field):
+        """
+        Returns the given field (e.g. "modify") as a POSIX timestamp, or None if it's not recorded.
+        """
+        return self._timestamps.get(field)
+
+TF._FIELDS = (
+    (TF.CREATION, 'creation'),
+    (TF.MODIFY, 'modify'),
+    (TF.ACCESS, 'access'),
+    (TF.ATTRIBUTES, 'attributes'),
+    (TF.BACKUP, 'backup'),
+    (TF.EXPIRATION, 'expiration'),
+    (TF.EFFECTIVE, 'effective'),
+)
+
+
+class Attributes(object):
+    """
+    The Rock Ridge attributes of a record, decoded from its SUSP entries in a single pass. Each is
+    None where the record doesn't carry it. ``timestamps`` maps TF field names (e.g. "modify") to
+    POSIX timestamps, and ``dev`` is the device number from a PN entry.
+    """
+    __slots__ = ('name', 'mode', 'nlinks', 'uid', 'gid', 'ino', 'timestamps', 'symlink', 'dev')
+
+    def __init__(self, entries):
+        self.mode = self.nlinks = self.uid = self.gid = self.ino = self.dev = None
+        self.timestamps = {}
+        name = symlink = None
+        name_done = symlink_done = False
+        for entry in entries:
+            if isinstance(entry, NM) and not name_done:
+                name = (name or b"") + entry.name
+                name_done = entry.flags & NM.CONTINUE == 0
+            elif isinstance(entry, SL) and not symlink_done:
+                symlink = (symlink or b"") + entry.path
+                symlink_done = entry.flags & SL.CONTINUE == 0
+            elif isinstance(entry, PX):
+                self.mode, self.nlinks, self.uid, self.gid, self.ino = \
+                    entry.mode, entry.nlinks, entry.uid, entry.gid, entry.ino
+            elif isinstance(entry, TF):
+                self.timestamps.update(entry._timestamps)
+            elif isinstance(entry, PN):
+                self.dev = (entry.dev_high << 32) | entry.dev_low
+        self.name = name
+        self.symlink = symlink
+
+    def __repr__(self):
+        return "<RockRidge %s>" % " ".join("%s=%r" % (slot, getattr(self, slot))
+                                           for slot in self.__slots__)
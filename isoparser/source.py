@@ -1,29 +1,121 @@
 import datetime
+import errno
+import io
+import mmap
+import os
+import re
 import struct
+import sys
+import collections
+import threading
+import time
 
-from six.moves.urllib import request
 from six.moves import range
 
-from . import path_table, record, volume_descriptors, susp
+from . import cache as cache_module, path_table, readahead as readahead_module, record, \
+    stats as stats_module, volume_descriptors, susp
 
 
 SECTOR_LENGTH = 2048
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+_DIR_DATETIME = struct.Struct('<6Bb')
+_structs = {}
+
+_HAS_PREADV = hasattr(os, 'preadv')
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)$")
+
+# In-kernel copies between file descriptors, where the platform has them. Each takes the source
+# and destination descriptors, the source offset and a byte count, and writes at the destination's
+# current position.
+if hasattr(os, 'copy_file_range'):
+    def _copy_file_range(in_fd, out_fd, offset, count):
+        return os.copy_file_range(in_fd, out_fd, count, offset)
+else:
+    _copy_file_range = None
+
+if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+    def _sendfile(in_fd, out_fd, offset, count):
+        return os.sendfile(out_fd, in_fd, offset, count)
+else:
+    _sendfile = None
+
+_COPY_UNSUPPORTED = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF)
+
+# Kernel advice matching the hints given to Source.advise(), where the platform has it
+if hasattr(os, 'posix_fadvise'):
+    _FADVISE = {
+        readahead_module.NORMAL: os.POSIX_FADV_NORMAL,
+        readahead_module.SEQUENTIAL: os.POSIX_FADV_SEQUENTIAL,
+        readahead_module.RANDOM: os.POSIX_FADV_RANDOM,
+        readahead_module.WILLNEED: os.POSIX_FADV_WILLNEED,
+    }
+else:
+    _FADVISE = None
+
+if hasattr(mmap.mmap, 'madvise'):
+    _MADVISE = {
+        readahead_module.NORMAL: mmap.MADV_NORMAL,
+        readahead_module.SEQUENTIAL: mmap.MADV_SEQUENTIAL,
+        readahead_module.RANDOM: mmap.MADV_RANDOM,
+        readahead_module.WILLNEED: mmap.MADV_WILLNEED,
+    }
+else:
+    _MADVISE = None
+
 
 class SourceError(Exception):
     pass
 
 
-class Source(object):
-    def __init__(self, cache_content=False, min_fetch=16):
-        self._buff = None
-        self._sectors = {}
-        self.cursor = None
-        self.cache_content = cache_content
-        self.min_fetch = min_fetch
-        self.susp_starting_index = None
-        self.susp_extensions = []
-        self.rockridge = False
+def _tobytes(data):
+    """
+    Returns a copy of the given bytes, bytearray or memoryview as bytes. Calling ``bytes()`` on a
+    memoryview gives its repr on Python 2.
+    """
+    return memoryview(data).tobytes()
+
+
+def _readinto(response, buff):
+    """
+    Reads from an HTTP response into the buffer, and returns the number of bytes read. Python 2's
+    responses have no ``readinto()``.
+    """
+    if hasattr(response, 'readinto'):
+        return response.readinto(buff)
+    data = response.read(len(buff))
+    buff[:len(data)] = data
+    return len(data)
+
+
+def _parse_content_range(content_range):
+    """
+    Decodes the Content-Range header of an HTTP 206 response, or of a multipart/byteranges part,
+    into the first and last byte offsets and the total size, which is None if not reported.
+    """
+    match = _CONTENT_RANGE.match(content_range)
+    if not match:
+        raise SourceError("Invalid Content-Range in HTTP 206 response")
+    start, end, size = int(match.group(1)), int(match.group(2)), match.group(3)
+    size = None if size == "*" else int(size)
+    if end < start or (size is not None and end >= size):
+        raise SourceError("Invalid Content-Range in HTTP 206 response")
+    return start, end, size
+
+
+class Buffer(object):
+    """
+    A parse context: a buffer of bytes read from a source, and a cursor into it. The ``unpack_*``
+    methods decode structures at the cursor and advance it. Buffers aren't shared, so any number
+    of them may be used at once, from any thread.
+    """
+    def __init__(self, source, buff, cursor=0):
+        self.source = source
+        self._buff = buff
+        self.cursor = cursor
 
     def __len__(self):
         return len(self._buff) - self.cursor
@@ -40,8 +132,11 @@ class Source(object):
         self.cursor += l
         return data
 
+    def unpack_bytes(self, l):
+        return _tobytes(self.unpack_raw(l))
+
     def unpack_all(self):
-        return self.unpack_raw(len(self))
+        return self.unpack_bytes(len(self))
 
     def unpack_boundary(self):
         return self.unpack_raw(SECTOR_LENGTH - (self.cursor % SECTOR_LENGTH))
@@ -54,32 +149,75 @@ class Source(object):
         return a
 
     def unpack_string(self, l):
-        return self.unpack_raw(l).rstrip(b' ')
+        return self.unpack_bytes(l).rstrip(b' ')
 
     def unpack(self, st):
-        if st[0] not in '<>':
-            st = '<' + st
-        d = struct.unpack(st, self.unpack_raw(struct.calcsize(st)))
-        if len(st) == 2:
+        compiled = _structs.get(st)
+        if compiled is None:
+            compiled = _structs[st] = struct.Struct(st if st[0] in '<>' else '<' + st)
+        d = self.unpack_struct(compiled)
+        if len(d) == 1:
             return d[0]
         else:
             return d
 
+    def unpack_struct(self, st):
+        """
+        Unpacks a precompiled :class:`struct.Struct` directly from the buffer.
+        """
+        if st.size > len(self):
+            raise SourceError("Source buffer under-run")
+        d = st.unpack_from(self._buff, self.cursor)
+        self.cursor += st.size
+        return d
+
+    def unpack_both_struct(self, le, be, both):
+        """
+        Unpacks a layout containing both-endian fields in one go. ``le`` and ``be`` are precompiled
+        structs of the same size: ``le`` describes the whole layout in little-endian, and ``be``
+        only the big-endian halves of the both-endian fields, with padding elsewhere. ``both`` is
+        an :func:`operator.itemgetter` selecting the little-endian values that must match them.
+        """
+        d = self.unpack_struct(le)
+        if be.unpack_from(self._buff, self.cursor - be.size) != both(d):
+            raise SourceError("Both-endian value mismatch")
+        return d
+
     def rewind(self, st):
         self.rewind_raw(struct.calcsize(st))
 
     def unpack_vd_datetime(self):
-        return self.unpack_raw(17)  # TODO
+        return self.unpack_bytes(17)  # TODO
 
     def unpack_dir_datetime(self):
-        epoch = datetime.datetime(1970, 1, 1)
-        date = self.unpack_raw(7)
-        t = [struct.unpack('<B', bytes([i]) if isinstance(i, int) else i)[0]
-             for i in date]
-        t.append(struct.unpack('<b', date[-1:])[0])
+        return self.decode_dir_datetime(self.unpack_raw(7))
+
+    @staticmethod
+    def decode_dir_timestamp(date):
+        """
+        Returns the POSIX timestamp of a 7-byte directory record date.
+        """
+        t = list(_DIR_DATETIME.unpack(date))
         t[0] += 1900
         t_offset = t.pop(-1) * 15 * 60.    # Offset from GMT in 15min intervals, converted to secs
-        t_timestamp = (datetime.datetime(*t) - epoch).total_seconds() - t_offset
+        return (datetime.datetime(*t) - _EPOCH).total_seconds() - t_offset
+
+    @staticmethod
+    def decode_vd_timestamp(date):
+        """
+        Returns the POSIX timestamp of a 17-byte volume descriptor date, or None if it's unset.
+        """
+        digits = _tobytes(date[:16]).decode('ascii', 'replace')
+        if not digits.isdigit() or int(digits[:4]) == 0:
+            return None
+        t = [int(digits[i:i + 2]) for i in range(4, 14, 2)]
+        t_offset = struct.unpack('b', date[16:17])[0] * 15 * 60.
+        t_datetime = datetime.datetime(int(digits[:4]), *t)
+        return (t_datetime - _EPOCH).total_seconds() + int(digits[14:16]) / 100. - t_offset
+
+    @staticmethod
+    def decode_dir_datetime(date):
+        t_timestamp = Buffer.decode_dir_timestamp(date)
         t_datetime = datetime.datetime.fromtimestamp(t_timestamp)
         t_readable = t_datetime.strftime('%Y-%m-%d %H:%M:%S')
         return t_readable
@@ -108,31 +246,33 @@ class Source(object):
             raise SourceError("Unknown volume descriptor type: %d" % ty)
         return vd
 
-    def unpack_path_table(self):
-        return path_table.PathTable(self)
+    def unpack_path_table(self, joliet=False, big_endian=False):
+        return path_table.PathTable(self, joliet, big_endian)
 
-    def unpack_record(self):
+    def unpack_record(self, record_class=None):
         start_cursor = self.cursor
         length = self.unpack('B')
         if length == 0:
             self.rewind('B')
             return None
-        new_record = record.Record(self, length-1, self.susp_starting_index)
+        new_record = (record_class or record.Record)(self, length-1, self.source.susp_starting_index)
         assert self.cursor == start_cursor + length
+        self.source.stats.tally()[0] += 1  # IOStats.RECORDS
         return new_record
 
     def unpack_susp(self, maxlen, possible_extension=0):
         if maxlen < 4:
             return None
         start_cursor = self.cursor
-        signature = self.unpack_raw(2).decode()
+        signature = self.unpack_bytes(2).decode()
         length = self.unpack('B')
         version = self.unpack('B')
         if maxlen < length:
             self.rewind_raw(4)
             return None
-        if possible_extension < len(self.susp_extensions):
-            extension = self.susp_extensions[possible_extension]
+        susp_extensions = self.source.susp_extensions
+        if possible_extension < len(susp_extensions):
+            extension = susp_extensions[possible_extension]
             ext_id_ver = (extension.ext_id, extension.ext_ver)
         else:
             ext_id_ver = None
@@ -145,39 +285,333 @@ class Source(object):
             self.cursor = start_cursor + 4
             new_susp = susp.UnknownEntry(self, ext_id_ver, (signature, version), length - 4)
         assert self.cursor == start_cursor + length
+        self.source.stats.tally()[1] += 1  # IOStats.SUSP_ENTRIES
         return new_susp
 
-    def seek(self, start_sector, length=SECTOR_LENGTH, is_content=False):
-        self.cursor = 0
-        self._buff = b""
+
+class Source(Buffer):
+    """
+    Base class for sources of sectors. Reads go through the sector cache, and return independent
+    buffers, so one source may serve any number of threads.
+
+    For compatibility, a source is also a :class:`Buffer` of its own, which :func:`seek` loads
+    with sectors. That buffer is shared state; prefer :func:`buffer` to get a private one.
+
+    Metadata reads, and content reads if content is cached, are extended with adaptive readahead
+    of between ``min_fetch`` and ``max_fetch`` sectors (see :mod:`isoparser.readahead`).
+
+    Reads are counted in ``stats``, a :class:`stats.IOStats`. If ``timings`` is true, fetch
+    durations are also collected there. See :attr:`fetch_hook` for tracing individual fetches.
+    """
+    def __init__(self, cache_content=False, min_fetch=16, cache=None, cache_bytes=None,
+                 content_cache_bytes=None, fetch_hook=None, timings=False, max_fetch=512):
+        super(Source, self).__init__(self, None, None)
+        if cache is None:
+            cache = cache_module.SectorCache(cache_bytes, content_cache_bytes)
+        self.cache = cache
+        self.pinned = {}
+        self.cache_content = cache_content
+        self.min_fetch = min_fetch
+        self.max_fetch = max(min_fetch, max_fetch)
+        self._readahead = readahead_module.Readahead(min_fetch, max_fetch)
+        self._content_readahead = readahead_module.Readahead(min_fetch, max_fetch)
+        self.susp_starting_index = None
+        self.susp_extensions = []
+        self.rockridge = False
+        self._lock = threading.RLock()
+        self.stats = stats_module.IOStats(timings)
+        self.fetch_hook = fetch_hook
+
+    @property
+    def fetch_hook(self):
+        """
+        A callable called as ``hook(sector, count, duration)`` after every fetch from the
+        underlying file or server, with the first sector and number of sectors requested and the
+        time taken in seconds, or None. Fetches are only timed while a hook is set or the source
+        keeps timings.
+        """
+        return self._fetch_hook
+
+    @fetch_hook.setter
+    def fetch_hook(self, hook):
+        self._fetch_hook = hook
+        self._timed = hook is not None or self.stats.fetch_times is not None
+
+    def _counted(self, sector, count, read, *args):
+        """
+        Calls ``read(*args)``, a fetch of ``count`` sectors from the given sector which returns the
+        number of bytes read, and counts it in ``stats``.
+        """
+        if not self._timed:
+            got = read(*args)
+            self._count_fetch(sector, count, got)
+            return got
+        start = _clock()
+        got = read(*args)
+        self._count_fetch(sector, count, got, _clock() - start)
+        return got
+
+    def _count_fetch(self, sector, count, nbytes, duration=None):
+        self.stats.add_fetch(sector, min(count, -(-nbytes // SECTOR_LENGTH)), nbytes, duration)
+        if self._fetch_hook is not None:
+            self._fetch_hook(sector, count, duration)
+
+    def read_sectors(self, start_sector, length=SECTOR_LENGTH, is_content=False):
+        """
+        Returns a buffer of ``length`` bytes starting at the given sector, going through the
+        sector cache. Reads that miss the cache are extended with readahead, unless they're for
+        content that isn't to be cached.
+        """
         do_caching = (not is_content or self.cache_content)
         n_sectors = 1 + (length - 1) // SECTOR_LENGTH
-        fetch_sectors = max(self.min_fetch, n_sectors) if do_caching else n_sectors
-        need_start = None
-
-        def fetch_needed(need_count):
-            data = self._fetch(need_start, need_count)
-            self._buff += data
-            if do_caching:
-                for sector_idx in range(need_count):
-                    self._sectors[need_start + sector_idx] = data[sector_idx*SECTOR_LENGTH:(sector_idx+1)*SECTOR_LENGTH]
-
-        for sector in range(start_sector, start_sector + fetch_sectors):
-            if sector in self._sectors:
-                if need_start is not None:
-                    fetch_needed(sector - need_start)
-                    need_start = None
-                # If we've gotten past the sectors we actually need, don't continue to fetch
-                if sector >= start_sector + n_sectors:
+        if not do_caching:
+            readahead = None
+        elif is_content:
+            readahead = self._content_readahead
+        else:
+            readahead = self._readahead
+
+        with self._lock:
+            runs, end_sector = self._plan_runs(start_sector, n_sectors, readahead)
+
+        # Assemble the sectors into a single preallocated buffer
+        buff = memoryview(bytearray((end_sector - start_sector) * SECTOR_LENGTH))
+        filled = 0
+        for run_start, count, cached in runs:
+            if cached is not None:
+                self.stats.add('cached_sectors', len(cached))
+                for data in cached:
+                    buff[filled:filled + len(data)] = data
+                    filled += len(data)
+                    if len(data) < SECTOR_LENGTH:
+                        break
+            else:
+                got = self._counted(run_start, count, self._fetch_into, run_start,
+                                    buff[filled:filled + count*SECTOR_LENGTH])
+                if do_caching:
+                    with self._lock:
+                        for offset in range(0, got, SECTOR_LENGTH):
+                            self.cache.put(
+                                run_start + offset // SECTOR_LENGTH,
+                                _tobytes(buff[filled + offset:filled + min(offset + SECTOR_LENGTH, got)]),
+                                is_content)
+                filled += got
+                if got < count*SECTOR_LENGTH:
                     break
-                self._buff += self._sectors[sector]
-            elif need_start is None:
-                need_start = sector
+            if filled % SECTOR_LENGTH:
+                break  # Short read at the end of the source
+
+        return buff[:min(length, filled)]
+
+    def _plan_runs(self, start_sector, n_sectors, readahead=None):
+        pinned = self.pinned
+        end_sector = start_sector + n_sectors
+
+        # If we already have all the sectors we need, don't read ahead at all. Otherwise read
+        # ahead from the first missing sector as far as the readahead policy says, but stop short
+        # of sectors we already have.
+        if readahead is not None:
+            for sector in range(start_sector, end_sector):
+                if sector not in pinned and sector not in self.cache:
+                    limit = sector + readahead.size(sector, end_sector - sector)
+                    while (end_sector < limit and end_sector not in pinned and
+                           end_sector not in self.cache):
+                        end_sector += 1
+                    readahead.position = end_sector
+                    break
+
+        # Split the range into alternating runs of cached and missing sectors, as lists of
+        # [first sector, sector count, cached data or None]. A run of cached sectors shorter than
+        # min_fetch between two missing runs is re-read along with them, so that we make as few
+        # fetches as possible.
+        runs = []
+        for sector in range(start_sector, end_sector):
+            data = pinned.get(sector)
+            if data is None:
+                data = self.cache.get(sector)
+            if runs and (runs[-1][2] is None) == (data is None):
+                runs[-1][1] += 1
+                if data is not None:
+                    runs[-1][2].append(data)
+            elif data is None and len(runs) >= 2 and runs[-1][1] < self.min_fetch:
+                island = runs.pop()
+                runs[-1][1] += island[1] + 1
+            else:
+                runs.append([sector, 1, None if data is None else [data]])
+
+        return runs, end_sector
+
+    def read_at(self, offset, length):
+        """
+        Returns a buffer of ``length`` bytes starting at the given byte offset, in the manner of
+        ``pread()``. No readahead is done, and the sectors read are only cached if the source was
+        created with ``cache_content=True``.
+        """
+        start_sector, skip = divmod(offset, SECTOR_LENGTH)
+        return self.read_sectors(start_sector, skip + length, is_content=True)[skip:]
+
+    def read_content(self, start_sector, length):
+        """
+        Returns the content of a file extent as bytes.
+        """
+        return _tobytes(self.read_sectors(start_sector, length, is_content=True))
+
+    def read_extents(self, extents, gap=None, max_span=1 << 24, workers=1):
+        """
+        Yields a ((sector, length), data) pair for each distinct (sector, length) extent given, as
+        for :func:`read_content`, in order of location. Extents at most ``gap`` sectors apart
+        (default ``min_fetch``) are read together, in spans of up to ``max_span`` bytes, so that
+        many small extents take few fetches. With several ``workers``, spans are read
+        concurrently, and still yielded in order.
+        """
+        if gap is None:
+            gap = self.min_fetch
+        spans = []
+        for extent in sorted(set(extents)):
+            sector, length = extent
+            # Empty extents cover no sectors, but are still yielded in their place
+            end = sector + (length + SECTOR_LENGTH - 1) // SECTOR_LENGTH
+            if (spans and sector - spans[-1][1] <= gap and
+                    (max(end, spans[-1][1]) - spans[-1][0]) * SECTOR_LENGTH <= max_span):
+                spans[-1][1] = max(end, spans[-1][1])
+                spans[-1][2].append(extent)
+            else:
+                spans.append([sector, end, [extent]])
+
+        def read_span(span):
+            start, end, members = span
+            if end == start:
+                return [(extent, b"") for extent in members]
+            data = self.read_sectors(start, (end - start) * SECTOR_LENGTH, is_content=True)
+            return [(extent, _tobytes(data[(extent[0] - start) * SECTOR_LENGTH:
+                                           (extent[0] - start) * SECTOR_LENGTH + extent[1]]))
+                    for extent in members]
+
+        if workers <= 1:
+            for span in spans:
+                for item in read_span(span):
+                    yield item
+            return
+
+        # Keep a bounded window of spans in flight, yielding results in order
+        from concurrent import futures
+        with futures.ThreadPoolExecutor(workers) as executor:
+            pending = collections.deque()
+            spans = iter(spans)
+            for span in spans:
+                pending.append(executor.submit(read_span, span))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                items = pending.popleft().result()
+                span = next(spans, None)
+                if span is not None:
+                    pending.append(executor.submit(read_span, span))
+                for item in items:
+                    yield item
+
+    def buffer(self, start_sector, length=SECTOR_LENGTH, is_content=False):
+        """
+        Returns a new :class:`Buffer` holding ``length`` bytes starting at the given sector.
+        """
+        return Buffer(self, self.read_sectors(start_sector, length, is_content))
+
+    def prefetch(self, extents, gap=None, readahead=False):
+        """
+        Reads the given (sector, length) extents into the sector cache as metadata, e.g. the
+        extents of directories that are about to be listed. Sectors already held are skipped, and
+        runs of missing sectors fewer than ``gap`` sectors apart (default ``min_fetch``) are merged
+        into a single fetch. If ``readahead`` is true, each run is extended with metadata readahead
+        as :func:`read_sectors` would, rather than fetched exactly.
+        """
+        runs = self.missing_runs(extents, gap)
+        if not runs:
+            return
+        if readahead:
+            for start_sector, count in runs:
+                self.read_sectors(start_sector, count * SECTOR_LENGTH)
+        else:
+            self._prefetch_runs(runs)
 
-        if need_start is not None:
-            fetch_needed(start_sector + fetch_sectors - need_start)
+    def missing_runs(self, extents, gap=None):
+        """
+        Returns a sorted list of [first sector, sector count] runs covering the sectors of the
+        given (sector, length) extents that aren't already held, merging runs fewer than ``gap``
+        sectors apart (default ``min_fetch``).
+        """
+        if gap is None:
+            gap = self.min_fetch
+        sectors = set()
+        for start_sector, length in extents:
+            sectors.update(range(start_sector, start_sector + 1 + (max(length, 1) - 1) // SECTOR_LENGTH))
+        with self._lock:
+            missing = sorted(s for s in sectors if s not in self.pinned and s not in self.cache)
 
-        self._buff = self._buff[:length]
+        runs = []
+        for sector in missing:
+            if runs and sector - (runs[-1][0] + runs[-1][1]) < gap:
+                runs[-1][1] = sector + 1 - runs[-1][0]
+            else:
+                runs.append([sector, 1])
+        return runs
+
+    def _prefetch_runs(self, runs):
+        for start_sector, count in runs:
+            buff = memoryview(bytearray(count * SECTOR_LENGTH))
+            got = self._counted(start_sector, count, self._fetch_into, start_sector, buff)
+            self.cache_sectors(start_sector, buff[:got])
+
+    def cache_sectors(self, start_sector, data):
+        """
+        Stores data read from the given sector in the sector cache, as metadata.
+        """
+        with self._lock:
+            for offset in range(0, len(data), SECTOR_LENGTH):
+                self.cache.put(start_sector + offset // SECTOR_LENGTH,
+                               _tobytes(data[offset:offset + SECTOR_LENGTH]))
+
+    def advise(self, hint, extents=()):
+        """
+        Advises the source of the reads to expect, in the manner of ``posix_fadvise()``. The hint
+        is one of:
+
+        ``'normal'``
+          Adaptive readahead (the default).
+        ``'sequential'``
+          Reads will move forward through the image: always read ahead ``max_fetch`` sectors, and
+          stream content in the largest windows.
+        ``'random'``
+          Reads will be scattered: don't read ahead.
+        ``'willneed'``
+          The given (sector, length) extents will be read soon, so read them now.
+        """
+        if hint == readahead_module.WILLNEED:
+            self.prefetch(extents)
+            return
+        if hint not in readahead_module.HINTS:
+            raise ValueError("Unknown hint: %r" % (hint,))
+        with self._lock:
+            for readahead in (self._readahead, self._content_readahead):
+                readahead.hint = hint
+                readahead.window = readahead.minimum
+
+    def buffer_from(self, data, cursor=0):
+        """
+        Returns a new :class:`Buffer` holding the given bytes, e.g. to decode data held elsewhere.
+        """
+        return Buffer(self, data, cursor)
+
+    def seek(self, start_sector, length=SECTOR_LENGTH, is_content=False):
+        self.load_buffer(self.read_sectors(start_sector, length, is_content))
+
+    def load_buffer(self, buff, cursor=0):
+        """
+        Points the buffer at the given bytes rather than at sectors of the source, e.g. to decode
+        data held elsewhere. Use :func:`save_cursor` and :func:`restore_cursor` to return to the
+        previous buffer afterwards.
+        """
+        self._buff = buff
+        self.cursor = cursor
 
     def save_cursor(self):
         return (self._buff, self.cursor)
@@ -185,32 +619,133 @@ class Source(object):
     def restore_cursor(self, cursor_def):
         self._buff, self.cursor = cursor_def
 
+    @property
+    def size(self):
+        """
+        The size of the image in bytes.
+        """
+        raise NotImplementedError
+
     def _fetch(self, sector, count=1):
         raise NotImplementedError
 
+    def _fetch_into(self, sector, buff):
+        """
+        Reads as many whole sectors as fit in the given writable buffer, starting at the given
+        sector. Returns the number of bytes read, which is short only at the end of the source.
+        """
+        data = self._fetch(sector, len(buff) // SECTOR_LENGTH)
+        buff[:len(data)] = data
+        return len(data)
+
+    def _pread_into(self, offset, buff):
+        """
+        Reads into the given writable buffer from the given byte offset, in the manner of
+        ``preadv()``. Returns the number of bytes read, which is short only at the end of the
+        source.
+        """
+        data = self.read_at(offset, len(buff))
+        buff[:len(data)] = data
+        return len(data)
+
     def get_stream(self, sector, length):
         raise NotImplementedError
 
+    def open(self, sector, length):
+        """
+        Returns an unbuffered, seekable :class:`ExtentReader` over ``length`` bytes starting at the
+        given sector.
+        """
+        return ExtentReader(self, sector*SECTOR_LENGTH, length)
+
+    def copy_to(self, sector, length, out, chunk_size=1 << 20):
+        """
+        Writes ``length`` bytes starting at the given sector to the binary file object ``out``,
+        reading up to ``chunk_size`` bytes at a time. Returns the number of bytes written.
+        """
+        reader = self.open(sector, length)
+        buff = memoryview(bytearray(min(chunk_size, length)))
+        done = 0
+        try:
+            while done < length:
+                got = reader.readinto(buff)
+                if not got:
+                    break
+                out.write(buff[:got])
+                done += got
+        finally:
+            reader.close()
+        return done
+
     def close(self):
         pass
 
 
+class ExtentReader(io.RawIOBase):
+    """
+    A raw, seekable binary file over a byte range of a source. Each ``readinto()`` is a single
+    positional read from the source, so readers are independent of one another and hold no more
+    than the caller's buffer; wrap one in an ``io.BufferedReader`` for readahead.
+    """
+    def __init__(self, source, offset, length):
+        super(ExtentReader, self).__init__()
+        self._source = source
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        elif whence != io.SEEK_SET:
+            raise ValueError("Invalid whence (%r)" % whence)
+        if pos < 0:
+            raise ValueError("Negative seek position %d" % pos)
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        size = min(len(b), self._length - self._pos)
+        if size <= 0:
+            return 0
+        got = self._read_into(self._offset + self._pos, memoryview(b)[:size])
+        self._pos += got
+        return got
+
+    def _read_into(self, offset, buff):
+        return self._source._pread_into(offset, buff)
+
+
 class FileStream(object):
-    def __init__(self, file, offset, length):
-        self._file = file
+    def __init__(self, source, offset, length):
+        self._source = source
         self._offset = offset
         self._length = length
         self.cur_offset = 0
 
     def read(self, *args):
         size = args[0] if args else -1
-        self._file.seek(self._offset + self.cur_offset)
         if size < 0 or size > self._length - self.cur_offset:
             size = self._length - self.cur_offset
-        data = self._file.read(size)
-        if data:
-            self.cur_offset += len(data)
-        return data
+        buff = bytearray(size)
+        got = self._source._pread_into(self._offset + self.cur_offset, memoryview(buff))
+        self.cur_offset += got
+        return bytes(buff[:got])
 
     def close(self):
         pass
@@ -220,30 +755,518 @@ class FileSource(Source):
     def __init__(self, path, **kwargs):
         super(FileSource, self).__init__(**kwargs)
         self._file = open(path, 'rb')
+        self._file_lock = threading.Lock()
+
+    def _pread_into(self, offset, buff):
+        sector = offset // SECTOR_LENGTH
+        count = (offset + len(buff) - 1) // SECTOR_LENGTH + 1 - sector
+        return self._counted(sector, count, self._preadv, offset, buff)
+
+    def _preadv(self, offset, buff):
+        if not _HAS_PREADV:
+            with self._file_lock:
+                self._file.seek(offset)
+                return self._file.readinto(buff) or 0
+        fd = self._file.fileno()
+        got = 0
+        while got < len(buff):
+            n = os.preadv(fd, [buff[got:]], offset + got)
+            if n == 0:
+                break
+            got += n
+        return got
 
     def _fetch(self, sector, count=1):
-        self._file.seek(sector*SECTOR_LENGTH)
-        return self._file.read(SECTOR_LENGTH*count)
+        buff = bytearray(SECTOR_LENGTH*count)
+        return bytes(buff[:self._fetch_into(sector, memoryview(buff))])
+
+    def _fetch_into(self, sector, buff):
+        return self._preadv(sector*SECTOR_LENGTH, buff)
+
+    @property
+    def size(self):
+        return os.fstat(self._file.fileno()).st_size
 
     def get_stream(self, sector, length):
-        return FileStream(self._file, sector*SECTOR_LENGTH, length)
+        return FileStream(self, sector*SECTOR_LENGTH, length)
+
+    def copy_to(self, sector, length, out, chunk_size=1 << 20):
+        """
+        Copies within the kernel with ``copy_file_range()`` or ``sendfile()`` where available and
+        ``out`` is a real file, falling back to reading through userspace.
+        """
+        offset = sector*SECTOR_LENGTH
+        for copy in (_copy_file_range, _sendfile):
+            if copy is None:
+                continue
+            try:
+                out_fd = out.fileno()
+                out.flush()
+            except (AttributeError, IOError, OSError):
+                break
+            done = 0
+            try:
+                while done < length:
+                    size = min(chunk_size, length - done)
+                    n = self._counted(sector + done // SECTOR_LENGTH,
+                                      (size - 1) // SECTOR_LENGTH + 1,
+                                      copy, self._file.fileno(), out_fd, offset + done, size)
+                    if n == 0:
+                        return done
+                    done += n
+                return done
+            except OSError as e:
+                if done or e.errno not in _COPY_UNSUPPORTED:
+                    raise
+        return super(FileSource, self).copy_to(sector, length, out, chunk_size)
+
+    def advise(self, hint, extents=()):
+        """
+        Also passes the hint on to the kernel with ``posix_fadvise()``, where available, in which
+        case ``'willneed'`` extents are read ahead by the kernel in the background rather than
+        read into the sector cache.
+        """
+        if _FADVISE is None or hint not in _FADVISE:
+            return super(FileSource, self).advise(hint, extents)
+        fd = self._file.fileno()
+        if hint == readahead_module.WILLNEED:
+            for sector, length in extents:
+                os.posix_fadvise(fd, sector*SECTOR_LENGTH, length, _FADVISE[hint])
+            return
+        super(FileSource, self).advise(hint, extents)
+        os.posix_fadvise(fd, 0, 0, _FADVISE[hint])
 
     def close(self):
         self._file.close()
 
 
+class MmapStream(object):
+    def __init__(self, view):
+        self._view = view
+        self.cur_offset = 0
+
+    def read(self, *args):
+        size = args[0] if args else -1
+        if size < 0 or size > len(self._view) - self.cur_offset:
+            size = len(self._view) - self.cur_offset
+        data = self._view[self.cur_offset:self.cur_offset + size]
+        self.cur_offset += size
+        return data
+
+    def close(self):
+        self._view = None
+
+
+class MmapSource(FileSource):
+    """
+    A file source backed by a read-only memory map of the whole image. Reads slice the map
+    directly rather than going through the sector cache, so buffers, file content and streams are
+    all ``memoryview`` objects referencing the mapping. On Python 2, whose maps can't be viewed,
+    they're copies sliced from the map instead.
+    """
+    def __init__(self, path, **kwargs):
+        super(MmapSource, self).__init__(path, **kwargs)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._view = memoryview(self._map)
+        except TypeError:
+            self._view = self._map
+
+    def read_sectors(self, start_sector, length=SECTOR_LENGTH, is_content=False):
+        offset = start_sector * SECTOR_LENGTH
+        return self._view[offset:offset + length]
+
+    def read_content(self, start_sector, length):
+        return self.read_sectors(start_sector, length)
+
+    def prefetch(self, extents, gap=None, readahead=False):
+        # Everything is already mapped
+        pass
+
+    def read_extents(self, extents, gap=None, max_span=1 << 24, workers=1):
+        # Nothing to coalesce, as every extent is a view into the mapping
+        for extent in sorted(set(extents)):
+            yield extent, self.read_content(*extent)
+
+    def advise(self, hint, extents=()):
+        """
+        Passes the hint on to the kernel with ``madvise()``, where available.
+        """
+        if hint not in readahead_module.HINTS:
+            raise ValueError("Unknown hint: %r" % (hint,))
+        if _MADVISE is None:
+            return
+        if hint != readahead_module.WILLNEED:
+            self._map.madvise(_MADVISE[hint])
+            return
+        for sector, length in extents:
+            # The start must be page aligned
+            offset = sector*SECTOR_LENGTH
+            skip = offset % mmap.PAGESIZE
+            length = min(length + skip, len(self._map) - offset + skip)
+            if length > 0:
+                self._map.madvise(_MADVISE[hint], offset - skip, length)
+
+    def _fetch(self, sector, count=1):
+        return _tobytes(self._view[sector*SECTOR_LENGTH:(sector+count)*SECTOR_LENGTH])
+
+    def _pread_into(self, offset, buff):
+        data = self._view[offset:offset + len(buff)]
+        buff[:len(data)] = data
+        return len(data)
+
+    def get_stream(self, sector, length):
+        offset = sector * SECTOR_LENGTH
+        return MmapStream(self._view[offset:offset + length])
+
+    def close(self):
+        self._buff = None
+        if self._view is not self._map:
+            self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Views handed out as record content are still alive; the mapping is unmapped once
+            # the last of them is garbage collected.
+            pass
+        super(MmapSource, self).close()
+
+
+class HTTPStream(object):
+    # Closing a response with no more than this many bytes left reads them out, so that its
+    # connection can go back to the pool rather than be closed
+    drain_limit = 1 << 16
+
+    def __init__(self, source, connection, response, length):
+        self._source = source
+        self._connection = connection
+        self._response = response
+        self._remaining = length
+
+    def read(self, *args):
+        size = args[0] if args else -1
+        if self._response is None:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._response.read(size)
+        self._remaining -= len(data)
+        if not data or self._remaining == 0:
+            self.close()
+        return data
+
+    def readinto(self, buff):
+        if self._response is None:
+            return 0
+        buff = buff[:self._remaining]
+        got = 0
+        while got < len(buff):
+            n = _readinto(self._response, buff[got:])
+            if not n:
+                self._connection.close()
+                self._response = None
+                raise SourceError("HTTP response ended early")
+            got += n
+        self._remaining -= got
+        if self._remaining == 0:
+            self.close()
+        return got
+
+    def close(self):
+        if self._response is None:
+            return
+        if 0 < self._remaining <= self.drain_limit:
+            try:
+                self._remaining -= len(self._response.read(self._remaining))
+            except (self._source._http_client.HTTPException, EnvironmentError):
+                pass
+        if self._remaining == 0 and self._response.isclosed():
+            self._source._release(self._connection)
+        else:
+            self._connection.close()
+        self._response = None
+
+
+class HTTPExtentReader(ExtentReader):
+    """
+    An :class:`ExtentReader` over HTTP. Sequential reads are served from one open range response.
+    The length of each range requested is chosen by a :class:`readahead.Readahead` of between
+    ``min_window`` and ``max_window`` bytes, which follows the source's hint: it grows as reading
+    continues where the last response ended, and shrinks after seeks elsewhere. A read after a seek
+    requests only what it needs, so that random access doesn't abandon responses part way through
+    and close their connections.
+    """
+    min_window = 1 << 18
+    max_window = 1 << 24
+
+    def __init__(self, source, offset, length):
+        super(HTTPExtentReader, self).__init__(source, offset, length)
+        self._stream = None
+        self._stream_offset = None
+        self._readahead = None
+
+    def _read_into(self, offset, buff):
+        seek = self._stream_offset is not None and self._stream_offset != offset
+        if self._stream is not None and seek:
+            self._stream.close()
+            self._stream = None
+        if self._stream is None or self._stream._remaining == 0:
+            if self._readahead is None:
+                self._readahead = readahead_module.Readahead(
+                    self.min_window, self.max_window, self._source._readahead.hint)
+            end = self._offset + self._length
+            length = self._readahead.size(offset, len(buff))
+            if seek and self._readahead.hint != readahead_module.SEQUENTIAL:
+                length = len(buff)
+                self._readahead.position = offset + length
+            length = min(length, end - offset)
+            self._stream = self._source._open_stream(offset, length)
+            self._stream_offset = offset
+        got = self._stream.readinto(buff)
+        self._stream_offset += got
+        return got
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        super(HTTPExtentReader, self).close()
+
+
 class HTTPSource(Source):
-    def __init__(self, url, **kwargs):
+    """
+    A source reading an image over HTTP(S) with range requests. Connections are kept alive and
+    reused, with up to ``pool_size`` idle connections held between requests.
+
+    :func:`prefetch` fetches its runs concurrently, on up to ``pool_size`` connections. If
+    ``multirange`` is true, it also batches up to ``max_ranges`` runs into each request using
+    multi-range ``Range`` headers, for servers that support ``multipart/byteranges`` responses.
+
+    If ``disk_cache`` is a directory, sectors fetched are also kept there in a
+    :class:`cache.DiskCache`, keyed by the URL and the image's ``ETag`` (or its size, if the
+    server doesn't send one), and later reads are served from it.
+    """
+    def __init__(self, url, pool_size=4, timeout=60, multirange=False, max_ranges=32,
+                 disk_cache=None, **kwargs):
+        # Imported here, so that only HTTP sources pay for them
+        from six.moves import http_client
+        from six.moves.urllib.parse import urlsplit
+
         super(HTTPSource, self).__init__(**kwargs)
         self._url = url
+        self._http_client = http_client
+        parts = urlsplit(url)
+        if parts.scheme == "https":
+            self._connection_class = http_client.HTTPSConnection
+        else:
+            self._connection_class = http_client.HTTPConnection
+        self._host = parts.netloc
+        self._path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        self._timeout = timeout
+        self._size = None
+        self._pool = []
+        self._pool_size = pool_size
+        self._pool_lock = threading.Lock()
+        self._executor = None
+        self.multirange = multirange
+        self.max_ranges = max_ranges
+        self._etag = None
+        self._disk_cache = None
+        self._disk_cache_dir = disk_cache
+
+    def _connect(self):
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        return self._connection_class(self._host, timeout=self._timeout)
+
+    def _release(self, connection):
+        with self._pool_lock:
+            if len(self._pool) < self._pool_size:
+                self._pool.append(connection)
+                return
+        connection.close()
+
+    def _request_range(self, offset, length):
+        """
+        Requests ``length`` bytes from the given offset. Returns a connection and a response
+        positioned at the start of the body, and the length of the body, which is short if the
+        range extends past the end of the image. Returns a response of None past the end of the
+        image.
+        """
+        connection, response = self._request("bytes=%d-%d" % (offset, offset + length - 1))
+        if response.status == 416:
+            response.read()
+            self._release(connection)
+            return connection, None, 0
+        if response.status != 206:
+            connection.close()
+            raise SourceError("Expected HTTP 206 response to range request, got %d %s" % (
+                response.status, response.reason))
+
+        self._etag = response.getheader("ETag")
+        try:
+            start, end = self._parse_content_range(response.getheader("Content-Range", ""))
+            if start != offset or end >= offset + length:
+                raise SourceError("HTTP 206 response has the wrong range: %d-%d" % (start, end))
+        except SourceError:
+            connection.close()
+            raise
+        return connection, response, end - start + 1
+
+    def _request(self, byte_ranges):
+        for attempt in range(2):
+            connection = self._connect()
+            try:
+                connection.request("GET", self._path, headers={"Range": byte_ranges})
+                return connection, connection.getresponse()
+            except (self._http_client.HTTPException, EnvironmentError):
+                # An idle connection may have been closed by the server; retry once on a new one
+                connection.close()
+                if attempt:
+                    raise
+
+    def _parse_content_range(self, content_range):
+        start, end, size = _parse_content_range(content_range)
+        if size is not None:
+            self._size = size
+        return start, end
+
+    def _open_disk_cache(self):
+        if self._disk_cache is None:
+            size = self.size  # Also learns the ETag
+            key = "%s\n%s" % (self._url, self._etag or size)
+            with self._pool_lock:
+                if self._disk_cache is None:
+                    self._disk_cache = cache_module.DiskCache(
+                        self._disk_cache_dir, key, size, SECTOR_LENGTH)
+        return self._disk_cache
+
+    def _prefetch_runs(self, runs):
+        if self.multirange:
+            batches = [runs[i:i + self.max_ranges] for i in range(0, len(runs), self.max_ranges)]
+
+            def fetch(batch):
+                # Counted as one fetch, from the first sector of the batch
+                self._counted(batch[0][0], sum(count for _, count in batch),
+                              self._prefetch_multirange, batch)
+        else:
+            batches = [[run] for run in runs]
+            fetch = super(HTTPSource, self)._prefetch_runs
+        if len(batches) == 1:
+            fetch(batches[0])
+            return
+        with self._pool_lock:
+            if self._executor is None:
+                from concurrent import futures
+                self._executor = futures.ThreadPoolExecutor(self._pool_size)
+        for _ in self._executor.map(fetch, batches):
+            pass
+
+    def _prefetch_multirange(self, runs):
+        connection, response = self._request("bytes=" + ",".join(
+            "%d-%d" % (SECTOR_LENGTH * sector, SECTOR_LENGTH * (sector + count) - 1)
+            for sector, count in runs))
+        try:
+            if response.status == 416:
+                response.read()
+                parts = []
+            elif response.status != 206:
+                raise SourceError("Expected HTTP 206 response to range request, got %d %s" % (
+                    response.status, response.reason))
+            elif response.getheader("Content-Type", "").startswith("multipart/byteranges"):
+                parts = self._parse_multipart(response)
+            else:
+                # The server may answer with a single range covering all those requested
+                start, _ = self._parse_content_range(response.getheader("Content-Range", ""))
+                parts = [(start, response.read())]
+        except Exception:
+            connection.close()
+            raise
+        self._release(connection)
+
+        for start, data in parts:
+            skip = -start % SECTOR_LENGTH
+            data = memoryview(data)[skip:]
+            self.cache_sectors((start + skip) // SECTOR_LENGTH, data)
+            if self._disk_cache_dir is not None:
+                self._open_disk_cache().write((start + skip) // SECTOR_LENGTH, data)
+        return sum(len(data) for _, data in parts)
+
+    def _parse_multipart(self, response):
+        match = re.search(r'boundary="?([^";]+)"?', response.getheader("Content-Type"))
+        if not match:
+            raise SourceError("Missing boundary in multipart/byteranges response")
+        delimiter = b"\r\n--" + match.group(1).encode("ascii")
+        parts = []
+        for part in (b"\r\n" + response.read()).split(delimiter)[1:]:
+            if part.startswith(b"--"):
+                break
+            headers, _, data = part.partition(b"\r\n\r\n")
+            match = re.search(br"(?im)^content-range:\s*(.*?)\s*$", headers)
+            if not match:
+                raise SourceError("Missing Content-Range in multipart/byteranges response")
+            start, end = self._parse_content_range(match.group(1).decode("ascii"))
+            if len(data) != end - start + 1:
+                raise SourceError("Wrong part length in multipart/byteranges response")
+            parts.append((start, data))
+        return parts
+
+    @property
+    def size(self):
+        if self._size is None:
+            self.get_stream(0, 1).close()
+        if self._size is None:
+            raise SourceError("Server did not report the image size")
+        return self._size
 
     def _fetch(self, sector, count=1):
         return self.get_stream(sector, count*SECTOR_LENGTH).read()
 
+    def _fetch_into(self, sector, buff):
+        if self._disk_cache_dir is not None:
+            got = self._open_disk_cache().read_into(sector, buff)
+            if got is not None:
+                return got
+
+        connection, response, length = self._request_range(sector*SECTOR_LENGTH, len(buff))
+        if response is None:
+            return 0
+        got = 0
+        while got < length:
+            n = _readinto(response, buff[got:length])
+            if not n:
+                connection.close()
+                raise SourceError("HTTP response ended early")
+            got += n
+        self._release(connection)
+
+        if self._disk_cache_dir is not None:
+            self._disk_cache.write(sector, buff[:got])
+        return got
+
     def get_stream(self, sector, length):
-        opener = request.FancyURLopener()
-        opener.http_error_206 = lambda *a, **k: None
-        opener.addheader("Range", "bytes=%d-%d" % (
-            SECTOR_LENGTH * sector,
-            SECTOR_LENGTH * sector + length - 1))
-        return opener.open(self._url)
+        return self._open_stream(sector*SECTOR_LENGTH, length)
+
+    def _open_stream(self, offset, length):
+        # Counted as a fetch when the response headers arrive
+        start = _clock() if self._timed else None
+        connection, response, got = self._request_range(offset, length)
+        sector = offset // SECTOR_LENGTH
+        self._count_fetch(sector, (offset + max(length, 1) - 1) // SECTOR_LENGTH + 1 - sector, got,
+                          None if start is None else _clock() - start)
+        return HTTPStream(self, connection, response, got)
+
+    def open(self, sector, length):
+        return HTTPExtentReader(self, sector*SECTOR_LENGTH, length)
+
+    def close(self):
+        with self._pool_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            pool, self._pool = self._pool, []
+        for connection in pool:
+            connection.close()
+        if self._disk_cache is not None:
+            self._disk_cache.close()
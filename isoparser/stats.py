@@ -0,0 +1,135 @@
+"""
+I/O statistics.
+
+Each source counts the fetches it makes from the underlying file or server, the sectors it serves
+from the sector cache rather than fetching, and the records and SUSP entries decoded from its
+sectors. Fetches are only timed when a fetch hook is set or timings were requested, so by default
+no clock is read.
+"""
+import threading
+
+
+class Histogram(object):
+    """
+    A histogram of durations. Each bucket is keyed by its exclusive upper bound in microseconds,
+    a power of two.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        bound = 1 << int(duration * 1e6).bit_length()
+        self.buckets[bound] = self.buckets.get(bound, 0) + 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'max_s': self.max,
+            'buckets_us': dict(self.buckets),
+        }
+
+
+class IOStats(object):
+    """
+    Counters for the reads made by a source:
+
+    fetches, fetched_bytes, fetched_sectors:
+      Reads from the underlying file or server, and the bytes and sectors they returned.
+
+    cached_sectors:
+      Sectors served from the sector cache (or the pinned sectors of an index) instead.
+
+    seeks:
+      Fetches that didn't start at the sector following the previous fetch.
+
+    records, susp_entries:
+      Directory records and SUSP entries decoded. These are counted for every record, so each
+      thread keeps its own tallies (see :func:`tally`), which are summed when read.
+
+    fetch_times:
+      A :class:`Histogram` of fetch durations if the source keeps timings, or None.
+
+    Reads through the memory map of a memory-mapped image aren't fetches, and aren't counted.
+    """
+    _COUNTERS = ('fetches', 'fetched_bytes', 'fetched_sectors', 'cached_sectors', 'seeks')
+
+    # Indexes into the lists returned by tally()
+    RECORDS = 0
+    SUSP_ENTRIES = 1
+
+    def __init__(self, timings=False):
+        self._lock = threading.Lock()
+        self._timings = timings
+        self._local = threading.local()
+        self._tallies = []
+        self.reset()
+
+    def tally(self):
+        """
+        Returns the calling thread's tallies of records and SUSP entries decoded, a list indexed by
+        ``RECORDS`` and ``SUSP_ENTRIES``. Only the calling thread may update it, which it can do
+        without taking a lock.
+        """
+        try:
+            return self._local.tally
+        except AttributeError:
+            tally = self._local.tally = [0, 0]
+            with self._lock:
+                self._tallies.append(tally)
+            return tally
+
+    def _total(self, index):
+        return sum(tally[index] for tally in list(self._tallies))
+
+    @property
+    def records(self):
+        return self._total(self.RECORDS)
+
+    @property
+    def susp_entries(self):
+        return self._total(self.SUSP_ENTRIES)
+
+    def reset(self):
+        """
+        Sets every counter back to zero.
+        """
+        with self._lock:
+            for name in self._COUNTERS:
+                setattr(self, name, 0)
+            for tally in self._tallies:
+                tally[:] = [0, 0]
+            self.fetch_times = Histogram() if self._timings else None
+            self._next_sector = None
+
+    def add_fetch(self, sector, count, nbytes, duration=None):
+        with self._lock:
+            self.fetches += 1
+            self.fetched_bytes += nbytes
+            self.fetched_sectors += count
+            if sector != self._next_sector:
+                self.seeks += 1
+            self._next_sector = sector + count
+            if duration is not None and self.fetch_times is not None:
+                self.fetch_times.add(duration)
+
+    def add(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def as_dict(self):
+        """
+        Returns the counters as a dict, with ``fetch_times`` as a dict of its own or None.
+        """
+        with self._lock:
+            stats = dict((name, getattr(self, name)) for name in self._COUNTERS)
+            stats['records'] = self.records
+            stats['susp_entries'] = self.susp_entries
+            stats['fetch_times'] = self.fetch_times and self.fetch_times.as_dict()
+        return stats
@@ -48,7 +48,7 @@ class SUSP_Entry(object):
 class UnknownEntry(SUSP_Entry):
     def __init__(self, source, ext_id_ver, sig_version, length):
         super(UnknownEntry, self).__init__(source, ext_id_ver, sig_version, length)
-        self.unknown_raw = source.unpack_raw(length)
+        self.unknown_raw = source.unpack_bytes(length)
 
     @property
     def _repr_keyvals(self):
@@ -115,9 +115,9 @@ class ER(SUSP_Entry):
         len_src = source.unpack('B')
         susp_assert(length == 4 + len_id + len_des + len_src)
         self.ext_ver = source.unpack('B')
-        self.ext_id  = source.unpack_raw(len_id).decode()
-        self.ext_des = source.unpack_raw(len_des).decode()
-        self.ext_src = source.unpack_raw(len_src).decode()
+        self.ext_id  = source.unpack_bytes(len_id).decode()
+        self.ext_des = source.unpack_bytes(len_des).decode()
+        self.ext_src = source.unpack_bytes(len_src).decode()
 
 class ES(SUSP_Entry):
     _implements = [
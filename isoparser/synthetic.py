@@ -0,0 +1,316 @@
+"""
+A small ISO 9660 image writer, for tests and benchmarks.
+
+Images are described by a tree of nested dicts mapping names (bytes) to file content (bytes),
+subdirectories (dicts) or, with Rock Ridge, :class:`Symlink` objects, as in the test data. :func:`generate_tree` builds such trees to order, and
+:func:`write` lays one out as an image, with or without Rock Ridge extensions.
+"""
+import struct
+
+from .source import SECTOR_LENGTH
+
+
+# A fixed recording date: 2020-01-02 03:04:05 GMT
+_DATE = struct.pack('<6Bb', 120, 1, 2, 3, 4, 5, 0)
+_VD_DATE = b'2020010203040500\x00'
+
+_MODE_DIR = 0o40755
+_MODE_FILE = 0o100644
+_MODE_SYMLINK = 0o120777
+
+
+def _both16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+
+def _both32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+
+def _sectors(length):
+    return (length + SECTOR_LENGTH - 1) // SECTOR_LENGTH
+
+
+def _susp(signature, payload, version=1):
+    return signature + struct.pack('BB', 4 + len(payload), version) + payload
+
+
+def _px(mode, nlinks):
+    return _susp(b'PX', _both32(mode) + _both32(nlinks) + _both32(0) + _both32(0))
+
+
+def _tf():
+    # Modify, access and attributes times, short form
+    return _susp(b'TF', b'\x0e' + _DATE * 3)
+
+
+def _nm(name):
+    return _susp(b'NM', b'\x00' + name)
+
+
+def _sl(target):
+    components = []
+    for i, component in enumerate(target.split(b'/')):
+        if component == b'':
+            if i == 0:
+                components.append(b'\x08\x00')  # Root
+            continue
+        if component == b'.':
+            components.append(b'\x02\x00')
+        elif component == b'..':
+            components.append(b'\x04\x00')
+        else:
+            components.append(struct.pack('BB', 0, len(component)) + component)
+    return _susp(b'SL', b'\x00' + b''.join(components))
+
+
+def _ce(location, offset, length):
+    return _susp(b'CE', _both32(location) + _both32(offset) + _both32(length))
+
+
+_SP = _susp(b'SP', b'\xbe\xef\x00')
+_ER = _susp(b'ER', struct.pack('BBBB', 10, 1, 1, 1) + b'RRIP_1991A' + b'-' + b'-')
+_CE_LENGTH = len(_ce(0, 0, 0))
+
+
+def _record(identifier, location, length, is_directory, system_use=b''):
+    pad = b'' if len(identifier) % 2 else b'\x00'
+    record_length = 33 + len(identifier) + len(pad) + len(system_use)
+    if record_length > 255:
+        raise ValueError("Directory record too long: %d bytes" % record_length)
+    return (struct.pack('BB', record_length, 0) + _both32(location) + _both32(length) + _DATE +
+            struct.pack('BBB', 2 if is_directory else 0, 0, 0) + _both16(1) +
+            struct.pack('B', len(identifier)) + identifier + pad + system_use)
+
+
+def _record_length(identifier, system_use_length):
+    return 33 + len(identifier) + (0 if len(identifier) % 2 else 1) + system_use_length
+
+
+class Symlink(object):
+    """
+    A symbolic link to ``target`` (bytes), for use as a value in a tree. It's written as an empty
+    file with a Rock Ridge SL entry.
+    """
+    def __init__(self, target):
+        self.target = target
+
+
+class _Entry(object):
+    """
+    A record to be written: a file or directory, with its ISO identifier and system use entries.
+    """
+    def __init__(self, name, identifier, value, parent):
+        self.name = name
+        self.identifier = identifier
+        self.value = value
+        self.parent = parent
+        self.is_directory = isinstance(value, dict)
+        self.location = 0
+        self.is_symlink = isinstance(value, Symlink)
+        self.length = 0 if self.is_directory or self.is_symlink else len(value)
+        self.children = []
+        self.inline = b''   # System use entries in the record, besides any CE entry
+        self.continued = b''  # System use entries moved to a continuation area
+        self.ce = None      # (location, offset) of the continuation area
+
+
+def generate_tree(files=100, fanout=4, depth=2, name_length=12, file_size=1024, rock_ridge=True):
+    """
+    Returns a tree of ``files`` files spread evenly over a hierarchy of directories ``depth``
+    levels deep, each with ``fanout`` subdirectories. Names are ``name_length`` bytes long; mixed
+    case if ``rock_ridge`` is true, and otherwise upper case, as ISO 9660 names are. Each file
+    holds ``file_size`` bytes of content derived from its name.
+    """
+    def make_name(prefix, number):
+        name = ("%s%d_" % (prefix, number)).encode('ascii')
+        filler = b'AbcdefghijklmnopqrstuvwxyZ' * (name_length // 26 + 1)
+        name += filler[:max(0, name_length - len(name))]
+        return name if rock_ridge else name.upper()
+
+    root = {}
+    directories = [root]
+    level = [root]
+    number = 0
+    for _ in range(depth):
+        next_level = []
+        for directory in level:
+            for _ in range(fanout):
+                subdirectory = {}
+                directory[make_name('d', number)] = subdirectory
+                number += 1
+                next_level.append(subdirectory)
+        directories.extend(next_level)
+        level = next_level
+
+    for i in range(files):
+        name = make_name('f', i)
+        seed = name + b'\n'
+        directories[i % len(directories)][name] = (seed * (file_size // len(seed) + 1))[:file_size]
+    return root
+
+
+def write(path_or_file, tree, rock_ridge=True, continuation=False):
+    """
+    Writes an image of the given tree to a path or binary file object. If ``rock_ridge`` is true,
+    names are held in Rock Ridge NM entries alongside PX and TF entries, and ISO identifiers are
+    generated. Otherwise the names must be valid ISO identifiers themselves. If ``continuation``
+    is true, each record's NM and TF entries are placed in a continuation area; they're also
+    placed there for any record whose entries don't fit in it.
+    """
+    root = _Entry(b'', b'\x00', tree, None)
+    root.parent = root
+
+    # Directories in path table order: by depth, then parent, then identifier
+    directories = [root]
+    files = []
+    for directory in directories:
+        names = sorted(directory.value)
+        for i, name in enumerate(names):
+            value = directory.value[name]
+            if rock_ridge:
+                identifier = ('D%d' % i if isinstance(value, dict) else 'F%d.;1' % i).encode('ascii')
+            else:
+                identifier = name if isinstance(value, dict) else name + b';1'
+            child = _Entry(name, identifier, value, directory)
+            directory.children.append(child)
+            (directories if child.is_directory else files).append(child)
+        directory.children.sort(key=lambda child: child.identifier)
+
+    # System use entries
+    if rock_ridge:
+        for entry in directories + files:
+            nlinks = 2 + sum(child.is_directory for child in entry.children)
+            if entry.is_directory:
+                entry.inline = _px(_MODE_DIR, nlinks)
+            elif entry.is_symlink:
+                entry.inline = _px(_MODE_SYMLINK, 1) + _sl(entry.value.target)
+            else:
+                entry.inline = _px(_MODE_FILE, 1)
+            names = _tf() + _nm(entry.name) if entry is not root else _tf()
+            if continuation or _record_length(entry.identifier, len(entry.inline + names)) > 255:
+                entry.continued = names
+            else:
+                entry.inline += names
+
+    def su_length(entry, base=b''):
+        if not rock_ridge:
+            return 0
+        return len(base) + len(entry.inline) + (_CE_LENGTH if entry.continued else 0)
+
+    def record_lengths(directory):
+        lengths = [_record_length(b'\x00', su_length(directory, _SP + _ER if directory is root
+                                                      else b'')),
+                   _record_length(b'\x01', su_length(directory.parent))]
+        for child in directory.children:
+            lengths.append(_record_length(child.identifier, su_length(child)))
+        return lengths
+
+    def extent_length(lengths):
+        sectors, used = 1, 0
+        for length in lengths:
+            if used + length > SECTOR_LENGTH:
+                sectors, used = sectors + 1, 0
+            used += length
+        return sectors * SECTOR_LENGTH
+
+    # Path tables
+    directory_numbers = dict((id(directory), i) for i, directory in enumerate(directories))
+    path_table_size = sum(8 + len(d.identifier) + len(d.identifier) % 2 for d in directories)
+
+    def path_table(fmt):
+        data = []
+        for directory in directories:
+            identifier = directory.identifier
+            parent = directory_numbers[id(directory.parent)] + 1
+            data.append(struct.pack(fmt, len(identifier), 0, directory.location, parent))
+            data.append(identifier + (b'\x00' if len(identifier) % 2 else b''))
+        return b''.join(data)
+
+    # Layout: volume descriptors, path tables, directories, continuation areas, file content
+    sector = 16 + 2
+    l_table_loc = sector
+    sector += _sectors(path_table_size)
+    m_table_loc = sector
+    sector += _sectors(path_table_size)
+    for directory in directories:
+        directory.location = sector
+        directory.length = extent_length(record_lengths(directory))
+        sector += directory.length // SECTOR_LENGTH
+
+    continuation_start = sector
+    ce_offset = SECTOR_LENGTH
+    for entry in directories + files:
+        if entry.continued:
+            if ce_offset + len(entry.continued) > SECTOR_LENGTH:
+                sector += 1
+                ce_offset = 0
+            entry.ce = (sector - 1, ce_offset)
+            ce_offset += len(entry.continued)
+    continuation_end = sector
+
+    for entry in files:
+        if entry.length:
+            entry.location = sector
+            sector += _sectors(entry.length)
+    volume_size = sector
+
+    # Write out
+    def su(entry, base=b''):
+        if not rock_ridge:
+            return b''
+        data = base + entry.inline
+        if entry.continued:
+            data += _ce(entry.ce[0], entry.ce[1], len(entry.continued))
+        return data
+
+    out = open(path_or_file, 'wb') if not hasattr(path_or_file, 'write') else path_or_file
+    try:
+        out.write(b'\x00' * 16 * SECTOR_LENGTH)
+
+        root_record = _record(b'\x00', root.location, root.length, True)
+        pvd = (b'\x01CD001\x01\x00' + b'ISOPARSER'.ljust(32) + b'SYNTHETIC'.ljust(32) +
+               b'\x00' * 8 + _both32(volume_size) + b'\x00' * 32 + _both16(1) + _both16(1) +
+               _both16(SECTOR_LENGTH) + _both32(path_table_size) +
+               struct.pack('<II', l_table_loc, 0) + struct.pack('>II', m_table_loc, 0) +
+               root_record + b' ' * (128 * 4 + 37 * 3) + _VD_DATE * 4 + b'\x01')
+        out.write(pvd.ljust(SECTOR_LENGTH, b'\x00'))
+        out.write(b'\xffCD001\x01'.ljust(SECTOR_LENGTH, b'\x00'))
+
+        for fmt in ('<BBIH', '>BBIH'):
+            out.write(path_table(fmt).ljust(_sectors(path_table_size) * SECTOR_LENGTH, b'\x00'))
+
+        for directory in directories:
+            parent = directory.parent
+            records = [
+                _record(b'\x00', directory.location, directory.length, True,
+                        su(directory, _SP + _ER if directory is root else b'')),
+                _record(b'\x01', parent.location, parent.length, True, su(parent)),
+            ]
+            for child in directory.children:
+                records.append(_record(child.identifier, child.location, child.length,
+                                       child.is_directory, su(child)))
+            extent, used = [], 0
+            for record in records:
+                if used + len(record) > SECTOR_LENGTH:
+                    extent.append(b'\x00' * (SECTOR_LENGTH - used))
+                    used = 0
+                extent.append(record)
+                used += len(record)
+            out.write(b''.join(extent).ljust(directory.length, b'\x00'))
+
+        if continuation_end > continuation_start:
+            area = bytearray((continuation_end - continuation_start) * SECTOR_LENGTH)
+            for entry in directories + files:
+                if entry.continued:
+                    offset = (entry.ce[0] - continuation_start) * SECTOR_LENGTH + entry.ce[1]
+                    area[offset:offset + len(entry.continued)] = entry.continued
+            out.write(bytes(area))
+
+        for entry in files:
+            if entry.length:
+                out.write(entry.value)
+                out.write(b'\x00' * (-entry.length % SECTOR_LENGTH))
+    finally:
+        if out is not path_or_file:
+            out.close()
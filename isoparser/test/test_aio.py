@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+"""
+Tests of the asyncio front end. Python 3 only, as they're written with async/await, so they're
+kept apart from test_iso.py, which Python 2 still runs.
+"""
+import asyncio
+import os
+import sys
+import threading
+import unittest
+import isoparser
+
+from isoparser._range_server import RangeServer
+from isoparser.aio import HTTPReader
+from isoparser.source import SourceError
+from isoparser.test.test_data import TEST_DATA
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "requires asyncio.run()")
+class TestAio(unittest.TestCase):
+    def test_aparse(self):
+        async def walk(record, content):
+            names = []
+            async for child in record.achildren():
+                names.append(child.name)
+                if child.is_directory:
+                    await walk(child, content[child.name])
+                else:
+                    first = await child.aread(1)
+                    self.assertEqual(first + await child.aread(), content[child.name])
+                    self.assertEqual(await child.aread(), b'')
+            self.assertEqual(sorted(names), sorted(content))
+
+        async def lookup(iso, path, content):
+            for name, value in content.items():
+                record = await iso.arecord(*(path + (name,)))
+                self.assertEqual(record.name, name)
+                if isinstance(value, dict):
+                    await lookup(iso, path + (name,), value)
+                else:
+                    self.assertEqual(await record.aread(), value)
+
+        async def check(path_or_url, content):
+            for test in (walk, lookup):
+                async with await isoparser.aparse(path_or_url) as iso:
+                    # Blocking reads are never made on the event loop's thread
+                    source = iso._source.source
+                    fetch_into = source._fetch_into
+                    loop_thread = threading.current_thread()
+
+                    def checked_fetch_into(sector, buff):
+                        self.assertIsNot(threading.current_thread(), loop_thread)
+                        return fetch_into(sector, buff)
+                    source._fetch_into = checked_fetch_into
+                    if test is walk:
+                        await walk(iso.root, content)
+                    else:
+                        await lookup(iso, (), content)
+                        # Kept name indexes are used without reading directories again
+                        name = sorted(content)[0]
+                        records = iso.stats['records']
+                        await iso.arecord(name)
+                        self.assertEqual(iso.stats['records'], records)
+
+        server = RangeServer(os.path.dirname(__file__))
+        self.addCleanup(server.stop)
+        for filename, content in TEST_DATA:
+            asyncio.run(check(filename, content))
+            asyncio.run(check(server.url(os.path.basename(filename)), content))
+
+    def test_aparse_options(self):
+        async def check(**kwargs):
+            async with await isoparser.aparse(TEST_DATA[0][0], **kwargs) as iso:
+                self.assertEqual(iso._source.source.min_fetch, kwargs.get('min_fetch', 16))
+
+        # Options of parse() that aren't supported are accepted only with their default values
+        asyncio.run(check(mmap=False, index=None, lazy=False, disk_cache=None, min_fetch=1))
+        for name in ('mmap', 'index', 'lazy', 'disk_cache'):
+            with self.assertRaisesRegex(ValueError, name):
+                asyncio.run(check(**{name: 'x'}))
+        with self.assertRaises(TypeError):
+            asyncio.run(check(readahead=True))
+
+    def test_content_range(self):
+        class Reader(HTTPReader):
+            async def _request(self, byte_range):
+                return response
+
+        async def read():
+            return await Reader("http://localhost/image.iso").read_into(1, bytearray(4096))
+
+        for content_range, body in [("bytes 2048-6143/8192", b'x' * 4096),
+                                    ("bytes 2048-4095/*", b'x' * 2048)]:
+            response = (206, {"content-range": content_range}, body)
+            self.assertEqual(asyncio.run(read()), len(body))
+        for content_range, body in [("bytes 0-4095/8192", b'x' * 4096),
+                                    ("bytes 2048-8191/8192", b'x' * 6144),
+                                    ("bytes 2048-6143/4096", b'x' * 4096),
+                                    ("bytes 2048-6143/8192", b'x' * 2048),
+                                    ("bytes 6143-2048/8192", b''),
+                                    ("", b'x' * 4096)]:
+            response = (206, {"content-range": content_range}, body)
+            with self.assertRaises(SourceError):
+                asyncio.run(read())
+
@@ -1,10 +1,28 @@
 #! /usr/bin/env python
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from concurrent import futures
 import isoparser
 
+from isoparser import bench, cache, readahead, refs, rockridge, synthetic
+
+from isoparser._range_server import RangeServer
 from isoparser.test.test_data import TEST_DATA
 
 
+def _resolve_content(ref):
+    record = refs.resolve(ref)
+    return record.name, record.content
+
+
 class TestIso(unittest.TestCase):
     def recursive_test_record(self, record, content):
         self.assertTrue(record.is_directory)
@@ -18,9 +36,652 @@ class TestIso(unittest.TestCase):
             else:
                 self.assertEqual(child.content, value)
 
+    def recursive_test_listing(self, record, content):
+        self.assertEqual(sorted(child.name for child in record.children), sorted(content))
+        for child in record.children:
+            child.susp_entries
+            if child.is_directory:
+                self.recursive_test_listing(child, content[child.name])
+
+    def recursive_test_lookup(self, iso, path, content):
+        for name, value in content.items():
+            record = iso.record(*(path + (name,)))
+            self.assertEqual(record.name, name)
+            if isinstance(value, dict):
+                self.recursive_test_lookup(iso, path + (name,), value)
+            else:
+                self.assertEqual(record.content, value)
+        for _ in range(2):
+            self.assertRaises(KeyError, iso.record, *(path + (b'missing',)))
+
     def test_root(self):
         for filename, content in TEST_DATA:
             iso = isoparser.parse(filename)
             self.assertEqual(len(iso.root.children), len(content))
             self.recursive_test_record(iso.root, content)
             iso.close()
+
+    def test_root_mmap(self):
+        for filename, content in TEST_DATA:
+            iso = isoparser.parse(filename, mmap=True)
+            self.recursive_test_record(iso.root, content)
+            iso.close()
+
+    def test_stream_mmap(self):
+        filename, content = TEST_DATA[0]
+        with isoparser.parse(filename, mmap=True) as iso:
+            stream = iso.record(b'something').get_stream()
+            data = bytes(stream.read(10)) + bytes(stream.read())
+            self.assertEqual(data, content[b'something'])
+
+    def check_open(self, iso, name, value):
+        with iso.record(name).open() as f:
+            self.assertEqual(f.read(10), value[:10])
+            self.assertEqual(f.read(), value[10:])
+            tail = value[-5:]
+            self.assertEqual(f.seek(-len(tail), 2), len(value) - len(tail))
+            self.assertEqual(f.read(), tail)
+            f.seek(3)
+            buff = bytearray(8)
+            got = f.readinto(buff)
+            self.assertEqual(bytes(buff[:got]), value[3:11])
+            self.assertEqual(f.tell(), 3 + got)
+        with iso.record(name).open(readahead=0) as f:
+            f.min_window = 16
+            self.assertEqual(b''.join(iter(lambda: f.read(7), b'')), value)
+            f.seek(len(value) + 10)
+            self.assertEqual(f.read(), b'')
+
+    def test_open(self):
+        server = RangeServer(os.path.dirname(__file__))
+        self.addCleanup(server.stop)
+        filename, content = TEST_DATA[0]
+        for path_or_url, kwargs in ((filename, {}), (filename, {'mmap': True}),
+                                    (server.url(os.path.basename(filename)), {})):
+            with isoparser.parse(path_or_url, **kwargs) as iso:
+                self.check_open(iso, b'something', content[b'something'])
+                self.check_open(iso, b'one', b'')
+
+    def test_open_random(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        value = bytes(bytearray(i % 251 for i in range(1 << 20)))
+        synthetic.write(os.path.join(tmpdir, 'image.iso'), {b'file': value})
+        server = RangeServer(tmpdir)
+        self.addCleanup(server.stop)
+        offsets = [(i * 104729) % (len(value) - 100) for i in range(32)]
+        with isoparser.parse(server.url('image.iso')) as iso:
+            record = iso.record(b'file')
+            connections = server.connections
+            with record.open(readahead=0) as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    self.assertEqual(f.read(100), value[offset:offset + 100])
+            # Seeks don't abandon responses, so connections are reused
+            self.assertLessEqual(server.connections - connections, 1)
+
+    def recursive_test_extracted(self, path, content):
+        self.assertEqual(sorted(os.listdir(path)), sorted(content))
+        for name, value in content.items():
+            if isinstance(value, dict):
+                self.recursive_test_extracted(os.path.join(path, name), value)
+            else:
+                with open(os.path.join(path, name), 'rb') as f:
+                    self.assertEqual(f.read(), value)
+
+    def test_extract(self):
+        for filename, content in TEST_DATA:
+            for workers in (1, 3):
+                tmpdir = tempfile.mkdtemp()
+                self.addCleanup(shutil.rmtree, tmpdir)
+                with isoparser.parse(filename) as iso:
+                    iso.extract(tmpdir, workers=workers)
+                    for record in iso.root.children:
+                        st = os.stat(os.path.join(tmpdir.encode(), record.name))
+                        self.assertEqual(st.st_mtime,
+                                         record.find_susp_entry(rockridge.TF).timestamp('modify'))
+                        self.assertEqual(st.st_mode,
+                                         record.find_susp_entry(rockridge.PX).mode)
+                self.recursive_test_extracted(tmpdir.encode(), content)
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename, content = TEST_DATA[0]
+        with isoparser.parse(filename) as iso:
+            iso.extract(tmpdir, paths=[(b'directory',), (b'something',)])
+        self.recursive_test_extracted(tmpdir.encode(), {
+            b'directory': content[b'directory'], b'something': content[b'something']})
+
+    def test_extract_symlinks(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        outside = os.path.join(tmpdir, 'outside.txt')
+        with open(outside, 'wb') as f:
+            f.write(b'untouched')
+        stream = io.BytesIO()
+        synthetic.write(stream, {
+            b'x': b'payload',
+            b'y': synthetic.Symlink(outside.encode()),
+        })
+        # Rename the symlink so that it shares its name with the file
+        data = stream.getvalue()
+        self.assertEqual(data.count(b'NM\x06\x01\x00y'), 1)
+        image = os.path.join(tmpdir, 'image.iso')
+        with open(image, 'wb') as f:
+            f.write(data.replace(b'NM\x06\x01\x00y', b'NM\x06\x01\x00x'))
+
+        dest = os.path.join(tmpdir, 'dest')
+        with isoparser.parse(image) as iso:
+            iso.extract(dest)
+        self.assertFalse(os.path.islink(os.path.join(dest, 'x')))
+        with open(os.path.join(dest, 'x'), 'rb') as f:
+            self.assertEqual(f.read(), b'payload')
+        with open(outside, 'rb') as f:
+            self.assertEqual(f.read(), b'untouched')
+
+        # A symlink already in the destination is replaced, not followed
+        dest = os.path.join(tmpdir, 'dest2')
+        os.mkdir(dest)
+        os.symlink(outside, os.path.join(dest, 'x'))
+        with isoparser.parse(image) as iso:
+            iso.extract(dest)
+        self.assertFalse(os.path.islink(os.path.join(dest, 'x')))
+        with open(outside, 'rb') as f:
+            self.assertEqual(f.read(), b'untouched')
+
+        synthetic.write(image, {b'y': synthetic.Symlink(b'../outside.txt')})
+        dest = os.path.join(tmpdir, 'dest3')
+        with isoparser.parse(image) as iso:
+            iso.extract(dest)
+        self.assertEqual(os.readlink(os.path.join(dest, 'y')), '../outside.txt')
+
+    def test_walk(self):
+        for filename, content in TEST_DATA:
+            with isoparser.parse(filename) as iso:
+                for order in ("physical", "depth"):
+                    walked = {}
+                    locations = []
+                    for path, dirs, files in iso.walk(order=order):
+                        locations.append(iso.record(*path).location)
+                        tree = walked
+                        for name in path:
+                            tree = tree[name]
+                        tree.update((d.name, {}) for d in dirs)
+                        tree.update((f.name, f.content) for f in files)
+                    self.assertEqual(walked, content)
+                    if order == "physical":
+                        self.assertEqual(locations, sorted(locations))
+
+                # Pruning
+                for path, dirs, files in iso.walk():
+                    self.assertEqual(path, ())
+                    del dirs[:]
+
+    def test_manifest(self):
+        def flatten(content, path=()):
+            for name, value in content.items():
+                if isinstance(value, dict):
+                    for item in flatten(value, path + (name,)):
+                        yield item
+                else:
+                    yield path + (name,), value
+
+        for filename, content in TEST_DATA:
+            expected = dict((path, (len(value), {
+                'sha256': hashlib.sha256(value).hexdigest(),
+                'md5': hashlib.md5(value).hexdigest()})) for path, value in flatten(content))
+            with isoparser.parse(filename) as iso:
+                for workers in (1, 4):
+                    items = list(iso.manifest(("sha256", "md5"), workers=workers, chunk_size=16))
+                    self.assertEqual(len(items), len(expected))
+                    self.assertEqual(dict((path, (size, digests))
+                                          for path, size, digests in items), expected)
+
+    def test_rock_ridge(self):
+        for filename, content in TEST_DATA:
+            with isoparser.parse(filename) as iso:
+                for child in iso.root.children:
+                    rock_ridge = child.rock_ridge
+                    self.assertIs(child.rock_ridge, rock_ridge)
+                    self.assertIn(rock_ridge.name, content)
+                    px = child.find_susp_entry(rockridge.PX)
+                    self.assertEqual((rock_ridge.mode, rock_ridge.nlinks, rock_ridge.uid),
+                                     (px.mode, px.nlinks, px.uid))
+                    self.assertEqual(rock_ridge.timestamps['modify'],
+                                     child.find_susp_entry(rockridge.TF).timestamp('modify'))
+                    self.assertIsNone(rock_ridge.symlink)
+
+    def test_joliet(self):
+        filename, content = TEST_DATA[1]
+        with isoparser.parse(filename) as iso:
+            self.assertFalse(iso.joliet)
+            self.assertTrue(iso.joliet_vd.is_joliet)
+        with isoparser.parse(filename, joliet=True) as iso:
+            self.assertTrue(iso.joliet)
+            # Joliet names are truncated to 64 characters
+            names = sorted(name.decode('utf-8')[:64].encode('utf-8').replace(b'?', b'_')
+                           for name in content)
+            self.assertEqual(sorted(child.name for child in iso.root.children), names)
+
+            # Directories are resolved through the Joliet path table
+            top = [name for name in content if name.startswith(b'nemque')][0]
+            path = (top[:64], b'\xc2\xa4', b'iso', b'something')
+            self.assertEqual(iso._path_table_prefix(path)[1], 3)
+            self.assertEqual(iso.record(*path).content,
+                             content[top][b'\xc2\xa4'][b'iso'][b'something'])
+            self.assertRaises(KeyError, iso.record, *path[:3] + (b'SOMETHING',))
+
+    def test_path_table(self):
+        for filename, content in TEST_DATA:
+            with isoparser.parse(filename, joliet=True) as iso:
+                walked = dict((path, [d.name for d in dirs]) for path, dirs, _ in iso.walk())
+                fetched = []
+                iso._source._fetch_into = lambda sector, buff: fetched.append(sector)
+                self.assertEqual(sorted(path for path, _ in iso.directories()), sorted(walked))
+                table = iso.joliet_path_table
+                for path, names in walked.items():
+                    children = table.children_dirs(*path)
+                    self.assertEqual(sorted(children), sorted(path + (name,) for name in names))
+                    for child in children:
+                        self.assertEqual(table.parent(*child), path)
+                self.assertIsNone(table.parent())
+                self.assertEqual(fetched, [])
+
+            # Fall back to the M-type table
+            with isoparser.parse(filename) as iso:
+                pvd = iso.volume_descriptors['primary']
+                pvd.path_table_l_loc = pvd.root_record.location
+                table = iso._read_path_table(pvd)
+                self.assertEqual(table.location, pvd.path_table_m_loc)
+                self.assertEqual(dict(table.paths), dict(iso.path_table.paths))
+                pvd.path_table_m_loc = pvd.root_record.location
+                pvd.path_table_opt_l_loc = pvd.path_table_opt_m_loc = 0
+                self.assertIsNone(iso._read_path_table(pvd))
+
+        # Without any path table, directories are walked from the root
+        tree = {b'A': {b'B': {b'C': b'c'}}, b'D': b'd'}
+        stream = io.BytesIO()
+        synthetic.write(stream, tree, rock_ridge=False)
+        data = bytearray(stream.getvalue())
+        data[16 * 2048 + 140:16 * 2048 + 156] = bytearray(16)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, 'image.iso')
+        with open(filename, 'wb') as f:
+            f.write(bytes(data))
+        with isoparser.parse(filename) as iso:
+            self.assertIsNone(iso.path_table)
+            self.assertEqual([path for path, _ in iso.directories()],
+                             [(), (b'A',), (b'A', b'B')])
+            self.recursive_test_lookup(iso, (), tree)
+
+    def test_synthetic(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for rock_ridge, continuation, name_length in [(False, False, 12), (True, False, 12),
+                                                      (True, True, 12), (True, False, 200)]:
+            tree = synthetic.generate_tree(files=40, fanout=3, depth=2, name_length=name_length,
+                                           file_size=3000, rock_ridge=rock_ridge)
+            path = os.path.join(tmpdir, 'synthetic.iso')
+            synthetic.write(path, tree, rock_ridge=rock_ridge, continuation=continuation)
+            with isoparser.parse(path) as iso:
+                self.assertEqual(bool(iso._source.rockridge), rock_ridge)
+                self.assertEqual(iso.volume_descriptors['primary'].volume_space_size * 2048,
+                                 os.path.getsize(path))
+                self.recursive_test_record(iso.root, tree)
+                self.recursive_test_lookup(iso, (), tree)
+
+        report = bench.run(files=20, fanout=2, depth=1, repeat=1, lookups=5, sources=("file",))
+        self.assertEqual(sorted(result["variant"] for result in report["results"]),
+                         sorted(bench.VARIANTS))
+        for result in report["results"]:
+            self.assertEqual(result["walk_entries"], 22)
+
+    def test_continuation_prefetch(self):
+        # Listing a directory reads its children's continuation areas in one batch, whichever
+        # way the directory is reached
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tree = synthetic.generate_tree(files=40, fanout=3, depth=2, file_size=100)
+        path = os.path.join(tmpdir, 'synthetic.iso')
+        synthetic.write(path, tree, continuation=True)
+        with isoparser.parse(path) as iso:
+            calls = []
+            prefetch = iso._source.prefetch
+            iso._source.prefetch = lambda extents, **kwargs: (calls.append(len(extents)),
+                                                              prefetch(extents, **kwargs))
+            listings = list(iso.walk())
+            self.assertEqual(len(calls), len(listings))
+            self.assertEqual(sum(calls), sum(len(dirs) + len(files)
+                                             for _, dirs, files in listings))
+            del calls[:]
+            iso.record(*listings[-1][0])
+            self.assertEqual(len(calls), len(listings[-1][0]))
+
+    def test_stats(self):
+        for filename, content in TEST_DATA:
+            fetches = []
+            with isoparser.parse(filename, timings=True,
+                                 fetch_hook=lambda *args: fetches.append(args)) as iso:
+                self.recursive_test_record(iso.root, content)
+                stats = iso.stats
+                self.assertEqual(stats['fetches'], len(fetches))
+                self.assertEqual(stats['fetch_times']['count'], len(fetches))
+                self.assertEqual(stats['fetched_sectors'], sum(count for _, count, _ in fetches))
+                self.assertGreater(stats['records'], len(content))
+                self.assertGreater(stats['susp_entries'], 0)
+                self.assertGreaterEqual(stats['seeks'], 1)
+                self.assertIn('hits', stats['cache'])
+
+                # A second pass over the directories is served from the sector cache
+                iso.fetch_hook = None
+                self.recursive_test_listing(iso.record(), content)
+                self.assertGreater(iso.stats['cached_sectors'], stats['cached_sectors'])
+
+                # Records decoded on other threads are counted too, and reset
+                records = iso.stats['records']
+                thread = threading.Thread(target=lambda: list(iso.root.children))
+                thread.start()
+                thread.join()
+                self.assertEqual(iso.stats['records'], records + 2 + len(content))
+                iso._source.stats.reset()
+                self.assertEqual(iso.stats['records'], 0)
+
+            # Without a hook or timings, fetches aren't timed
+            clock = isoparser.source._clock
+            isoparser.source._clock = None
+            try:
+                with isoparser.parse(filename) as iso:
+                    self.recursive_test_record(iso.root, content)
+                    self.assertGreater(iso.stats['fetches'], 0)
+                    self.assertIsNone(iso.stats['fetch_times'])
+            finally:
+                isoparser.source._clock = clock
+
+    def test_readahead(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'synthetic.iso')
+        tree = synthetic.generate_tree(files=200, fanout=4, depth=3, file_size=100)
+        synthetic.write(path, tree)
+
+        def walk(hint):
+            fetches = []
+            with isoparser.parse(path, min_fetch=1, max_fetch=64,
+                                 fetch_hook=lambda *args: fetches.append(args[1])) as iso:
+                iso.advise(hint)
+                for _, dirs, files in iso.walk():
+                    pass
+            return fetches
+
+        # Directory extents follow one another, so the window grows as the walk goes on
+        normal = walk('normal')
+        self.assertEqual(max(normal), 64)
+        self.assertEqual(walk('sequential')[-1], 64)
+        random = walk('random')
+        self.assertLess(max(random), 8)
+        self.assertLess(len(normal), len(random) // 4)
+
+        with isoparser.parse(path) as iso:
+            self.assertRaises(ValueError, iso.advise, 'often')
+            names = sorted(name for name, value in tree.items() if not isinstance(value, dict))
+            records = [iso.record(name) for name in names]
+            iso.advise('willneed', records)
+            for name, record in zip(names, records):
+                self.assertEqual(record.content, tree[name])
+
+    def test_readahead_policy(self):
+        policy = readahead.Readahead(4, 32)
+        self.assertEqual([policy.size(start, 1) for start in (0, 4, 12, 28, 60)], [4, 8, 16, 32, 32])
+        self.assertEqual(policy.size(1000, 1), 16)
+        self.assertEqual(policy.size(5000, 40), 40)
+        policy.hint = 'sequential'
+        self.assertEqual(policy.size(0, 1), 32)
+        policy.hint = 'random'
+        self.assertEqual(policy.size(32, 1), 1)
+
+    def test_read_many(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'synthetic.iso')
+        tree = synthetic.generate_tree(files=60, fanout=2, depth=1, file_size=3000)
+        synthetic.write(path, tree)
+        server = RangeServer(tmpdir)
+        self.addCleanup(server.stop)
+        paths = [(name,) for name, value in sorted(tree.items()) if not isinstance(value, dict)]
+
+        for path_or_url, kwargs in ((path, {}), (path, {'mmap': True}),
+                                    (server.url('synthetic.iso'), {})):
+            # No readahead, so that no file content is read along with the directories
+            with isoparser.parse(path_or_url, min_fetch=1, max_fetch=1, **kwargs) as iso:
+                # Every other file, two sectors apart
+                wanted = sorted(paths, key=lambda path: iso.record(*path).location)[::2]
+                for gap, workers in ((0, 1), (2, 1), (2, 3)):
+                    before = iso.stats['fetches']
+                    results = list(iso.read_many(wanted, gap=gap, workers=workers))
+                    fetches = iso.stats['fetches'] - before
+                    self.assertEqual([(record.name,) for record, _ in results], wanted)
+                    for record, data in results:
+                        self.assertEqual(data, tree[record.name])
+                    if kwargs:
+                        self.assertEqual(fetches, 0)
+                    elif gap == 0:
+                        self.assertEqual(fetches, len(wanted))
+                    else:
+                        self.assertEqual(fetches, 1)
+
+                # Records may be given too, and repeated
+                record = iso.record(*paths[0])
+                results = list(iso.read_many([record, paths[0], paths[1]]))
+                self.assertEqual([r.name for r, _ in results], [paths[0][0]] * 2 + [paths[1][0]])
+
+        # Empty files are yielded in their place too
+        for filename, content in TEST_DATA:
+            for workers in (1, 3):
+                with isoparser.parse(filename) as iso:
+                    files = [record for record in iso.root.children if not record.is_directory]
+                    results = list(iso.read_many(files, workers=workers))
+                    locations = [record.location for record, _ in results]
+                    self.assertEqual(locations, sorted(locations))
+                    self.assertEqual(len(results), len(files))
+                    for record, data in results:
+                        self.assertEqual(data, content[record.name])
+
+    def test_lazy(self):
+        for filename, content in TEST_DATA:
+            fetches = []
+            with isoparser.parse(filename, lazy=True,
+                                 fetch_hook=lambda *args: fetches.append(args)) as iso:
+                # Opening reads just the primary volume descriptor
+                self.assertEqual([fetch[:2] for fetch in fetches], [(16, 1)])
+                volume_identifier = iso.primary_vd.volume_identifier
+                self.assertEqual(len(fetches), 1)
+                self.assertEqual(volume_identifier,
+                                 iso.volume_descriptors['primary'].volume_identifier)
+                self.assertIs(iso.volume_descriptors['primary'], iso.primary_vd)
+                self.recursive_test_record(iso.root, content)
+                self.recursive_test_lookup(iso, (), content)
+
+            with isoparser.parse(filename, lazy=True) as iso:
+                self.assertEqual(sorted(location for _, location in iso.directories()),
+                                 sorted(iso.record(*path).location for path, _, _ in iso.walk()))
+
+        # HTTP support and logging aren't imported until they're needed
+        script = ("import sys, isoparser; "
+                  "isoparser.parse(%r, lazy=True).close(); "
+                  "sys.exit(any(name.split('.')[0] in ('http', 'urllib', 'logging') "
+                  "for name in sys.modules))" % TEST_DATA[0][0])
+        self.assertEqual(subprocess.call([sys.executable, '-c', script]), 0)
+
+    def test_refs(self):
+        for filename, content in TEST_DATA:
+            for kwargs in ({}, {'joliet': True}):
+                with isoparser.parse(filename, **kwargs) as iso:
+                    expected = {}
+                    files = []
+                    for path, dirs, records in iso.walk():
+                        parent = iso.record(*path)
+                        for record in dirs + records:
+                            ref = pickle.loads(pickle.dumps(iso.ref(record, parent)))
+                            self.assertEqual(ref.location, record.location)
+                            self.assertEqual(ref.is_directory, record.is_directory)
+                            self.assertEqual(ref.parent, parent.location)
+                            self.assertEqual(ref.joliet, iso.joliet)
+                            if not record.is_directory:
+                                files.append(ref)
+                                expected[ref] = (record.name, record.content)
+
+                registry = refs.Registry()
+                self.addCleanup(registry.close)
+                for ref in files:
+                    record = ref.resolve(registry)
+                    self.assertEqual((record.name, record.content), expected[ref])
+
+                with futures.ProcessPoolExecutor(2) as executor:
+                    results = list(executor.map(_resolve_content, files))
+                self.assertEqual(results, [expected[ref] for ref in files])
+
+        # Only images opened with parse() can be reopened
+        with isoparser.iso.ISO(isoparser.source.FileSource(filename)) as iso:
+            self.assertRaises(ValueError, iso.ref, iso.root)
+
+    def test_bounded_cache(self):
+        for filename, content in TEST_DATA:
+            iso = isoparser.parse(filename, cache_content=True, cache_bytes=8192,
+                                  content_cache_bytes=4096)
+            self.recursive_test_record(iso.root, content)
+            stats = iso.cache.stats
+            self.assertLessEqual(stats['metadata_bytes'], 8192)
+            self.assertLessEqual(stats['content_bytes'], 4096)
+            self.assertGreater(stats['evictions'], 0)
+            self.assertGreater(stats['hits'], 0)
+            iso.close()
+
+    def test_threads(self):
+        for filename, content in TEST_DATA:
+            iso = isoparser.parse(filename, cache_bytes=8192)
+            errors = []
+
+            def worker():
+                try:
+                    for _ in range(20):
+                        self.recursive_test_record(iso.root, content)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            iso.close()
+
+    def test_record(self):
+        for filename, content in TEST_DATA:
+            with isoparser.parse(filename) as iso:
+                self.recursive_test_lookup(iso, (), content)
+
+    def test_index(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for filename, content in TEST_DATA:
+            index_path = os.path.join(tmpdir, os.path.basename(filename) + '.idx')
+            with isoparser.parse(filename) as iso:
+                iso.build_index(index_path)
+
+            iso = isoparser.parse(filename, index=index_path)
+            fetched = []
+            fetch_into = iso._source._fetch_into
+            iso._source._fetch_into = lambda sector, buff: fetched.append(sector) or fetch_into(sector, buff)
+            self.recursive_test_listing(iso.root, content)
+            self.assertEqual(fetched, [])
+            self.recursive_test_record(iso.root, content)
+            iso.close()
+
+        # An index for a different image is ignored
+        with isoparser.parse(TEST_DATA[1][0], index=index_path.replace('test2', 'test')) as iso:
+            self.assertEqual(iso._source.pinned, {})
+            self.recursive_test_record(iso.root, TEST_DATA[1][1])
+
+    def test_http(self):
+        server = RangeServer(os.path.dirname(__file__))
+        self.addCleanup(server.stop)
+        for filename, content in TEST_DATA:
+            with isoparser.parse(server.url(os.path.basename(filename))) as iso:
+                self.recursive_test_record(iso.root, content)
+                self.assertEqual(iso._source.size, os.path.getsize(filename))
+        self.assertLessEqual(server.connections, 2)
+
+    def test_http_stream(self):
+        server = RangeServer(os.path.dirname(__file__))
+        self.addCleanup(server.stop)
+        filename, content = TEST_DATA[0]
+        with isoparser.parse(server.url(os.path.basename(filename))) as iso:
+            stream = iso.record(b'something').get_stream()
+            data = stream.read(10) + stream.read()
+            self.assertEqual(data, content[b'something'])
+            stream.close()
+            self.assertEqual(iso.record(b'a').content, content[b'a'])
+        self.assertEqual(server.connections, 1)
+
+    def test_http_prefetch(self):
+        server = RangeServer(os.path.dirname(__file__))
+        self.addCleanup(server.stop)
+        filename, content = TEST_DATA[1]
+        for multirange in (False, True):
+            iso = isoparser.parse(server.url(os.path.basename(filename)), min_fetch=1)
+            iso._source.multirange = multirange
+            iso.root.prefetch_children()
+            requests = server.requests
+            for child in iso.root.children_unsafe:
+                if child.is_directory:
+                    list(child.children_unsafe)
+            self.assertEqual(server.requests, requests)
+            self.recursive_test_record(iso.root, content)
+            iso.close()
+
+    def test_disk_cache_shared(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        first = cache.DiskCache(tmpdir, 'image', 1 << 31, 2048)
+        self.addCleanup(first.close)
+        second = cache.DiskCache(tmpdir, 'image', 1 << 31, 2048)
+        self.addCleanup(second.close)
+        buff = memoryview(bytearray(2048))
+        first.write(0, b'a' * 2048)
+        first.write(4, b'e' * 2048)
+        self.assertEqual(first.read_into(0, buff), 2048)
+        self.assertIsNone(first.read_into(1, buff))
+
+        # Writes by one instance are seen by the other, however the first has read before
+        second.write(1, b'b' * 2048)
+        self.assertEqual(first.read_into(1, buff), 2048)
+        self.assertEqual(buff.tobytes(), b'b' * 2048)
+
+        # Neither instance's bitmap updates erase the other's
+        first.write(2, b'c' * 2048)
+        second.write(3, b'd' * 2048)
+        for instance in (first, second):
+            for sector, value in enumerate(b'abcde'):
+                self.assertEqual(instance.read_into(sector, buff), 2048)
+                self.assertEqual(buff.tobytes(), bytes(bytearray([value])) * 2048)
+
+    @unittest.skipIf(sys.version_info >= (3, 6), "aparse() is supported")
+    def test_aparse_unsupported(self):
+        self.assertRaises(NotImplementedError, isoparser.aparse, TEST_DATA[0][0])
+
+    def test_http_disk_cache(self):
+        server = RangeServer(os.path.dirname(__file__))
+        self.addCleanup(server.stop)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for filename, content in TEST_DATA:
+            url = server.url(os.path.basename(filename))
+            with isoparser.parse(url, disk_cache=tmpdir) as iso:
+                self.recursive_test_record(iso.root, content)
+            requests = server.requests
+            with isoparser.parse(url, disk_cache=tmpdir) as iso:
+                self.recursive_test_record(iso.root, content)
+            # Only the request learning the image's size and ETag
+            self.assertEqual(server.requests, requests + 1)
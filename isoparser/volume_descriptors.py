@@ -1,3 +1,22 @@
+import operator
+import struct
+
+from . import record
+
+
+# Primary (and supplementary) volume descriptor fields up to the path table locations, following
+# the type, identifier and version
+_PRIMARY_LE = struct.Struct('<B32s32s8xi4x32sh2xh2xh2xi4x')
+_PRIMARY_BE = struct.Struct('>77xi32x2xh2xh2xh4xi')
+_PRIMARY_BOTH = operator.itemgetter(3, 5, 6, 7, 8)
+
+# Escape sequences identifying the UCS-2 levels of a Joliet supplementary volume descriptor
+_JOLIET_ESCAPES = (b'%/@', b'%/C', b'%/E')
+
+# Primary volume descriptor fields following the root directory record
+_PRIMARY_TAIL = struct.Struct('<128s128s128s128s38s36s37s17s17s17s17sB')
+
+
 class VolumeDescriptor(object):
     name = None
 
@@ -14,42 +33,67 @@ class BootVD(VolumeDescriptor):
 
 class PrimaryVD(VolumeDescriptor):
     name = "primary"
+    record_class = None
 
     def __init__(self, source):
         super(PrimaryVD, self).__init__(source)
 
-        _                                  = source.unpack_raw(1)     # unused
-        self.system_identifier             = source.unpack_string(32)
-        self.volume_identifier             = source.unpack_string(32)
-        _                                  = source.unpack_raw(8)     # unused
-        self.volume_space_size             = source.unpack_both('i')
-        _                                  = source.unpack_raw(32)    # unused
-        self.volume_set_size               = source.unpack_both('h')
-        self.volume_seq_num                = source.unpack_both('h')
-        self.logical_block_size            = source.unpack_both('h')
-        self.path_table_size               = source.unpack_both('i')
-        self.path_table_l_loc              = source.unpack('<i')
-        self.path_table_opt_l_loc          = source.unpack('<i')
-        self.path_table_m_loc              = source.unpack('>i')
-        self.path_table_opt_m_loc          = source.unpack('>i')
-        self.root_record                   = source.unpack_record()
-        self.volume_set_identifier         = source.unpack_string(128)
-        self.publisher_identifier          = source.unpack_string(128)
-        self.data_preparer_identifier      = source.unpack_string(128)
-        self.application_identifier        = source.unpack_string(128)
-        self.copyright_file_identifier     = source.unpack_string(38)
-        self.abstract_file_identifier      = source.unpack_string(36)
-        self.bibliographic_file_identifier = source.unpack_string(37)
-        self.volume_datetime_created       = source.unpack_vd_datetime()
-        self.volume_datetime_modified      = source.unpack_vd_datetime()
-        self.volume_datetime_expires       = source.unpack_vd_datetime()
-        self.volume_datetime_effective     = source.unpack_vd_datetime()
-        self.file_structure_version        = source.unpack('B')
-
-
-class SupplementaryVD(VolumeDescriptor):
+        (
+            self.volume_flags,
+            self.system_identifier,
+            self.volume_identifier,
+            self.volume_space_size,
+            self.escape_sequences,
+            self.volume_set_size,
+            self.volume_seq_num,
+            self.logical_block_size,
+            self.path_table_size,
+        ) = source.unpack_both_struct(_PRIMARY_LE, _PRIMARY_BE, _PRIMARY_BOTH)
+        self.system_identifier             = self.system_identifier.rstrip(b' ')
+        self.volume_identifier             = self.volume_identifier.rstrip(b' ')
+        self.path_table_l_loc, self.path_table_opt_l_loc = source.unpack('<ii')
+        self.path_table_m_loc, self.path_table_opt_m_loc = source.unpack('>ii')
+        self.root_record                   = source.unpack_record(self.record_class)
+        (
+            self.volume_set_identifier,
+            self.publisher_identifier,
+            self.data_preparer_identifier,
+            self.application_identifier,
+            self.copyright_file_identifier,
+            self.abstract_file_identifier,
+            self.bibliographic_file_identifier,
+            self.volume_datetime_created,
+            self.volume_datetime_modified,
+            self.volume_datetime_expires,
+            self.volume_datetime_effective,
+            self.file_structure_version,
+        ) = source.unpack_struct(_PRIMARY_TAIL)
+        self.volume_set_identifier         = self.volume_set_identifier.rstrip(b' ')
+        self.publisher_identifier          = self.publisher_identifier.rstrip(b' ')
+        self.data_preparer_identifier      = self.data_preparer_identifier.rstrip(b' ')
+        self.application_identifier        = self.application_identifier.rstrip(b' ')
+        self.copyright_file_identifier     = self.copyright_file_identifier.rstrip(b' ')
+        self.abstract_file_identifier      = self.abstract_file_identifier.rstrip(b' ')
+        self.bibliographic_file_identifier = self.bibliographic_file_identifier.rstrip(b' ')
+
+
+class SupplementaryVD(PrimaryVD):
+    """
+    A supplementary volume descriptor. It has the layout of the primary volume descriptor, plus
+    volume flags and escape sequences. If the escape sequences identify a Joliet volume, its
+    directory hierarchy is made of :class:`record.JolietRecord` objects.
+    """
     name = "supplementary"
 
+    @property
+    def record_class(self):
+        return record.JolietRecord if self.is_joliet else None
+
+    @property
+    def is_joliet(self):
+        escapes = self.escape_sequences.rstrip(b'\x00')
+        return any(escapes.startswith(escape) for escape in _JOLIET_ESCAPES)
+
 
 class PartitionVD(VolumeDescriptor):
     name = "partition"
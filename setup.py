@@ -1,4 +1,19 @@
+import sys
+
 from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+class BuildPy(build_py):
+    """
+    Leaves out the asyncio front end where its async/await syntax can't be compiled.
+    """
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 6):
+            modules = [module for module in modules if module[:2] != ("isoparser", "aio")]
+        return modules
+
 
 setup(
     name='isoparser',
@@ -8,6 +23,7 @@ setup(
     url='https://github.com/barneygale/isoparser',
     license='MIT',
     description='Parser for the ISO 9660 disk image format',
-    install_requires=['six'],
+    install_requires=['six', 'futures; python_version < "3"'],
     packages=["isoparser"],
+    cmdclass={'build_py': BuildPy},
 )